@@ -42,7 +42,7 @@ class ContinuousLearner(ThreadRunnable):
             self.get_local_raw_img_dir_today()
             if not self.loop_run or self.sync_now:
                 break
-            time.sleep(1)
+            self.sleep(1)
 
     def on_end(self):
         self.exit_nicely()
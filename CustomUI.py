@@ -77,11 +77,13 @@ class DataCollectionDialog(QDialog):
         cap_cnt = 0
         self.btn_capture.setEnabled(False)
         while cap_cnt < target and not self.stop_cap:
+            if not self.buffer.wait_for_new(0.5):
+                continue
             ret, result = self.buffer.get()
-            if ret and result['num_spots'] == 0:
+            if ret and result.num_spots == 0:
                 cap_cnt += 1
                 img_out = self.data_handler.get_local_raw_img_dir_today() + f"/{platform.node()}_raw_{get_current_time_filename()}_{cap_cnt}.jpg"
-                cv.imwrite(img_out, result['raw'])
+                cv.imwrite(img_out, result.raw)
                 self.data_handler.record_new_raw_timestamp()
                 Log.info(f"Raw image{cap_cnt} has been saved to{img_out}")
                 self.progress_bar.setValue(cap_cnt)
@@ -1,10 +1,19 @@
 import ctypes
-import queue
+import threading
 import typing
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable
 
 import ContinuousLearner
-from Yolov5TRT import Yolov5TRT
+from libs.ComponentSpotDetector import ComponentSpotDetector
+from libs.Detections import *
+from libs.FrameRing import FrameRing, FramePool
+from libs.FrameSource import *
+from libs.MotionGate import MotionGate
+from libs.PatternBackground import PatternBackgroundModel
+from libs.StripStitcher import FabricCoverage, WebDisplacement
 from libs.FunctionPipeline import FunctionPipeline
 from libs.ImageProcessingFunctions import *
 from libs.Log import *
@@ -14,23 +23,117 @@ from libs.utils import *
 
 
 class BufferPackedResult:
-    def __init__(self, buffer_size=2):
-        self.buffer = queue.Queue(buffer_size)
-
-    def put(self, packed_result: dict):
-        try:
-            self.buffer.put_nowait(packed_result)
-        except queue.Full:
-            self.buffer.get_nowait()
-            self.buffer.put_nowait(packed_result)
+    """
+    Result hand-over between two stages, newest wins.
+    buffer_size=1 is a single-slot mailbox, a larger size keeps the newest results in a bounded ring and drops
+    the oldest one when full (e.g. one result per camera in multi-camera mode).
+    deque.append / popleft are atomic, so no lock is taken per frame; consumers block in wait_for_new()
+    instead of polling get().
+    on_drop is called with every dropped result, e.g. to hand its frame slot back (DetectorProcesses.py).
+    """
 
-    def get(self) -> typing.Tuple[bool, dict]:
+    def __init__(self, buffer_size=2):
+        self.buffer = deque(maxlen=max(1, buffer_size))
+        self.new_result_event = threading.Event()
+        self.num_put = 0
+        self.num_dropped = 0  # results overwritten before anyone took them
+        self.on_drop = None
+
+    def put(self, packed_result: 'FrameResult'):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.num_dropped += 1
+            if self.on_drop is not None:
+                try:
+                    self.on_drop(self.buffer.popleft())
+                except IndexError:
+                    # taken by the consumer in the meantime
+                    pass
+        self.buffer.append(packed_result)
+        self.num_put += 1
+        self.new_result_event.set()
+
+    def get(self) -> typing.Tuple[bool, typing.Optional['FrameResult']]:
         try:
-            packed_result = self.buffer.get_nowait()
-            self.buffer.task_done()
-            return True, packed_result
-        except queue.Empty:
-            return False, {}
+            return True, self.buffer.popleft()
+        except IndexError:
+            return False, None
+
+    def get_latest(self) -> typing.Tuple[bool, typing.Optional['FrameResult']]:
+        # skip everything but the newest result
+        ret, packed_result = self.get()
+        while ret and len(self.buffer) > 0:
+            self.num_dropped += 1
+            if self.on_drop is not None:
+                self.on_drop(packed_result)
+            ret, packed_result = self.get()
+        return ret, packed_result
+
+    def has_new(self) -> bool:
+        return len(self.buffer) > 0
+
+    def wait_for_new(self, timeout: float = None) -> bool:
+        self.new_result_event.clear()
+        if len(self.buffer) == 0:
+            self.new_result_event.wait(timeout)
+        return len(self.buffer) > 0
+
+    def wake_waiters(self):
+        # release a consumer blocked in wait_for_new(), e.g. on shutdown
+        self.new_result_event.set()
+
+    def drop_rate(self) -> float:
+        return self.num_dropped / self.num_put if self.num_put > 0 else 0.
+
+
+class FrameResult:
+    """
+    One frame on its way through the pipeline: FramePreProcessor -> detector -> FrameProcessingEngine -> DetectorApp.
+    Each stage stamps the time it was done with the frame (t_*), so the latency of every stage can be told apart.
+    """
+    STAGES = ('capture', 'preprocess', 'detect', 'postprocess', 'display')
+    __slots__ = ('camera_id', 'raw', 'processed', 'overlay', 'unchanged', 'gate_reference', 'web_position', 'strip',
+                 'coverage', 'detector', 'detections', 'candidates', 'detector_latency', 'num_spots', 'fps_capture', 'fps_fpp',
+                 'detector_fps', 'camera_fps', 'inference_time',
+                 't_capture', 't_preprocess', 't_detect', 't_postprocess', 't_display')
+
+    def __init__(self, camera_id=0, t_capture=0.):
+        self.camera_id = camera_id
+        self.raw = None
+        self.processed = None
+        self.overlay = None  # drawn on demand by ResultRenderer
+        self.unchanged = False  # same scene as the motion gate reference of the camera, see MotionGate
+        self.gate_reference = None  # id of that reference
+        self.web_position = None  # px the web moved since the first frame of the camera, see StripStitcher
+        self.strip = None  # (start, stop) lines of the new fabric inspected in this frame
+        self.coverage = None  # inspected / travelled fabric length of the camera
+        self.detector = ''
+        self.detections = None
+        self.candidates = None  # detections of the CV screener in cascade mode
+        self.detector_latency = {}  # detector name: ms, fused mode
+        self.num_spots = 0
+        self.fps_capture = 0
+        self.fps_fpp = 0
+        self.detector_fps = 0
+        self.camera_fps = -1
+        self.inference_time = 0
+        self.t_capture = t_capture
+        self.t_preprocess = 0.
+        self.t_detect = 0.
+        self.t_postprocess = 0.
+        self.t_display = 0.
+
+    def stage_latencies(self) -> dict:
+        """
+        return: {stage: ms spent from the previous stage to this one}, for the stages the frame went through
+        """
+        latencies = {}
+        last = self.t_capture
+        for stage in self.STAGES[1:]:
+            stamp = getattr(self, f't_{stage}')
+            if stamp > 0:
+                latencies[stage] = (stamp - last) * 1000
+                last = stamp
+        return latencies
 
 
 class RecordFPS:
@@ -48,13 +151,137 @@ class RecordFPS:
         self.fps = 1 / (time.time() - self.timer)
 
 
+class ReuseUnchangedResult:
+    """
+    Detector side of the motion gate: frames the pre-processor marked as unchanged take over the detections of the
+    last detected frame of their camera instead of running the detector again, if that frame was compared with the
+    same gate reference.
+    """
+    DETECTOR_NAME = ''
+
+    def __init__(self):
+        self.last_detections = {}  # camera_id: (detections, num_spots, gate_reference)
+
+    def reuse_unchanged(self, packed_results: list) -> list:
+        """
+        return: the results that still need a detection, the reused ones are put right away
+        """
+        to_detect = []
+        for packed_result in packed_results:
+            last = self.last_detections.get(packed_result.camera_id)
+            if not packed_result.unchanged or last is None or last[2] != packed_result.gate_reference:
+                to_detect.append(packed_result)
+                continue
+            packed_result.detector = self.DETECTOR_NAME
+            packed_result.detections, packed_result.num_spots = last[:2]
+            if packed_result.processed is None:
+                packed_result.processed = packed_result.raw
+            packed_result.detector_fps = self.fps
+            packed_result.t_detect = time.time()
+            self.put(packed_result)
+        return to_detect
+
+    def remember_detections(self, packed_result: 'FrameResult'):
+        self.last_detections[packed_result.camera_id] = (packed_result.detections, packed_result.num_spots,
+                                                         packed_result.gate_reference)
+
+
+class StitchStrips(ABC):
+    """
+    Detector side of strip stitching (see StripStitcher.py): frames the pre-processor stamped with a web position
+    are only searched where new fabric came into view since the last inspected frame of their camera, the spots found
+    before are carried along with the web. Frames without enough new fabric are finished by finish_carried().
+    """
+    _GAP_WARNING_INTERVAL = 5  # sec
+
+    def __init__(self, settings: 'DetectSettings', min_strip_setting: str, min_strip_fraction: float):
+        self.strip_stitching = settings.get_or_set_setting_value('stripStitching', False)
+        self.strip_axis = settings.get_or_set_setting_value('cvFabricAxis', 0)
+        self.strip_margin = settings.get_or_set_setting_value('stripMargin', 16)
+        # new fabric needed before a frame is inspected, fraction of the frame length
+        self.min_strip_fraction = settings.get_or_set_setting_value(min_strip_setting, min_strip_fraction)
+        self.fabric_coverage = {}  # camera_id: FabricCoverage
+        self.gap_warning_time = 0.
+
+    def get_fabric_coverage(self, cam: int) -> FabricCoverage:
+        coverage = self.fabric_coverage.get(cam)
+        if coverage is None:
+            coverage = FabricCoverage(self.strip_axis, self.strip_margin, self.min_strip_fraction)
+            self.fabric_coverage[cam] = coverage
+        return coverage
+
+    def plan_strips(self, packed_results: list) -> list:
+        """
+        return: the results with new fabric to inspect, the others are finished right away with the carried spots
+        """
+        if not self.strip_stitching:
+            return packed_results
+        to_detect = []
+        carried = []
+        for packed_result in packed_results:
+            if packed_result.web_position is None:
+                to_detect.append(packed_result)
+                continue
+            cam = packed_result.camera_id
+            frame = packed_result.raw if packed_result.processed is None else packed_result.processed
+            coverage = self.get_fabric_coverage(cam)
+            packed_result.strip = coverage.plan(packed_result.web_position, frame.shape[self.strip_axis])
+            if coverage.last_gap > 0 and time.time() - self.gap_warning_time > self._GAP_WARNING_INTERVAL:
+                self.gap_warning_time = time.time()
+                Log.warning(f"{round(coverage.last_gap)} px of fabric passed camera {cam} without inspection, "
+                            f"{round(coverage.coverage() * 100, 1)} % inspected so far. "
+                            f"The detector is too slow for the line speed.")
+            if packed_result.strip is None:
+                carried.append(packed_result)
+            else:
+                to_detect.append(packed_result)
+        if len(carried) > 0:
+            self.finish_carried(carried)
+        return to_detect
+
+    @abstractmethod
+    def finish_carried(self, packed_results: list): pass
+
+    def strip_window(self, packed_result: 'FrameResult') -> typing.Optional[tuple]:
+        """
+        return: (start, stop) lines to search, None: the whole frame
+        """
+        if packed_result.strip is None:
+            return None
+        return self.get_fabric_coverage(packed_result.camera_id).window(packed_result.strip)
+
+    def stitch(self, packed_result: 'FrameResult', detections: np.ndarray) -> np.ndarray:
+        """
+        return: the spots in view, the new ones centred in the strip and the carried ones
+        """
+        if not self.strip_stitching or packed_result.web_position is None:
+            return detections
+        coverage = self.get_fabric_coverage(packed_result.camera_id)
+        if packed_result.strip is not None:
+            coverage.add(detections, packed_result.web_position, packed_result.strip)
+        packed_result.coverage = coverage.coverage()
+        return coverage.carry(packed_result.web_position)
+
+    def coverage_summary(self) -> str:
+        return ", ".join(f"camera {cam}: {round(coverage.coverage() * 100, 1)} % of {round(coverage.travelled)} px "
+                         f"inspected, {coverage.num_gaps} gaps ({round(coverage.gap)} px)"
+                         for cam, coverage in sorted(self.fabric_coverage.items()))
+
+
 _DETECTOR_CONFIG_FILE_ = f'config/{platform.node()}_detector_config.dict'
+_NOT_SET = object()
 
 
 class DetectSettings:
     def save_config_to_file(self):
+        config_dict = dict(self.config_dict)
+        for setting_name, value in self.overridden.items():
+            if value is _NOT_SET:
+                del config_dict[setting_name]
+            else:
+                config_dict[setting_name] = value
         with open(self.config_file, 'wb') as configs:
-            pickle.dump(self.config_dict, configs)
+            pickle.dump(config_dict, configs)
 
     def read_config_from_file(self):
         try:
@@ -81,38 +308,129 @@ class DetectSettings:
             self.config_dict[setting_name] = value
             return value
 
-    def set_setting_value(self, setting_name: str, value):
-        Log.info(f"Setting change. {setting_name}: {value}")
+    def subscribe_to_any_change(self, call_back_func: Callable):
+        # call_back_func(setting_name, value) on every set_setting_value()
+        self.config_on_any_change.append(call_back_func)
+
+    def apply_setting_value(self, setting_name: str, value):
+        # update and notify without saving, e.g. for a change forwarded from another process
         self.config_dict[setting_name] = value
         if setting_name in self.config_on_change_dict:
             for func in self.config_on_change_dict[setting_name]:
                 func(value)
+
+    def override_setting_value(self, setting_name: str, value):
+        # update and notify like apply_setting_value(), but the config file keeps the value from before the first
+        # override until set_setting_value() sets a new one, e.g. for the operating point of the quality scheduler
+        if setting_name not in self.overridden:
+            self.overridden[setting_name] = self.config_dict.get(setting_name, _NOT_SET)
+        self.apply_setting_value(setting_name, value)
+
+    def set_setting_value(self, setting_name: str, value):
+        Log.info(f"Setting change. {setting_name}: {value}")
+        self.overridden.pop(setting_name, None)
+        self.apply_setting_value(setting_name, value)
+        for func in self.config_on_any_change:
+            func(setting_name, value)
         self.save_config_to_file()
 
     def __init__(self, config_file: str):
         self.config_file = config_file
         self.require_init = False
         self.config_dict = {}  # setting_name: setting_value
+        self.overridden = {}  # setting_name: value to save instead of the overriding one
         self.read_config_from_file()
         Log.info(f"Initial Settings: {self.config_dict}")
         self.config_on_change_dict = {}  # setting_name: [list of call back function]
+        self.config_on_any_change = []  # [list of call back function]
 
 
-# Frame pre-processor: read frame from gstreamer and preprocess the frame
-class FramePreProcessor(ThreadRunnable, BufferPackedResult, RecordFPS):
-    def __init__(self, settings: DetectSettings):
+# Frame grabber: decode frames from the capture device into a ring of preallocated buffers on its own thread
+class FrameGrabber(ThreadRunnable, RecordFPS):
+    _REOPEN_DEBOUNCE = 0.5  # sec, coalesce pipeline rebuilds while a slider is being dragged
+    _CONSUME_WAIT_TIMEOUT = 0.1
+
+    def __init__(self, source: FrameSource, ring_size=4, new_frame_event: threading.Event = None):
         ThreadRunnable.__init__(self)
-        BufferPackedResult.__init__(self)
         RecordFPS.__init__(self)
-        if 'Win' in platform.platform() or ('Linux' in platform.platform() and 'x86' in platform.platform()):
-            self.cap = cv.VideoCapture(0)
-            self.cap_width = self.cap.set(cv.CAP_PROP_FRAME_WIDTH, 1280)
-            self.cap_height = self.cap.set(cv.CAP_PROP_FRAME_HEIGHT, 720)
+        self.ring_size = ring_size
+        self.new_frame_event = new_frame_event
+        self.source = None
+        self.ring = None
+        self._reopen_source = None
+        self._reopen_timer = 0
+        self.set_source(source)
+        self.set_daemon()
+
+    def set_source(self, source: FrameSource):
+        if not source.open():
+            Log.error(f"Failed to open frame source {source}")
+        self.source = source
+        self.cap_width, self.cap_height = source.get_size()
+        old_ring = self.ring
+        self.ring = FrameRing(self.ring_size, (self.cap_height, self.cap_width, 3), new_frame_event=self.new_frame_event)
+        if old_ring is not None:
+            old_ring.wake()
+
+    def request_reopen(self, source: FrameSource):
+        """
+        Switch to a new source (e.g. a rebuilt gstreamer pipeline) on the grabber thread.
+        """
+        self._reopen_source = source
+        self._reopen_timer = time.time()
+
+    def reopen(self):
+        source, self._reopen_source = self._reopen_source, None
+        Log.info(f"Re-opening frame source: {source}")
+        self.source.release()
+        self.set_source(source)
+
+    def release(self):
+        self.source.release()
+
+    def exit_nicely(self, *args):
+        self.thread_stop()
+        Log.info("FrameGrabber terminated nicely.")
+
+    def on_start(self):
+        Log.info(f"FrameGrabber started with {self.ring.num_slots} frame buffers...")
+
+    def main_body(self):
+        if self._reopen_source is not None and time.time() - self._reopen_timer > self._REOPEN_DEBOUNCE:
+            self.reopen()
+        ring = self.ring
+        if self.source.lossless and not ring.wait_for_consumed(self._CONSUME_WAIT_TIMEOUT):
+            return
+        idx = ring.begin_write()
+        ret, frame = self.source.read(ring.slots[idx])
+        if ret:
+            ring.commit(idx, frame)
+            self._FPSUpdateFPS_()
+            self._FPSStartPoint_()
         else:
-            self.cap = cv.VideoCapture(gstreamer_pipeline())
-        self.cap_width = self.cap.get(cv.CAP_PROP_FRAME_WIDTH)
-        self.cap_height = self.cap.get(cv.CAP_PROP_FRAME_HEIGHT)
+            ring.abort(idx)
+            if self.source.is_finished():
+                Log.info(f"Frame source {self.source} finished.")
+                self.thread_stop()
+            else:
+                self.sleep(0.01)  # camera not ready, do not spin
+
+    def wake(self):
+        if self.ring is not None:
+            self.ring.wake()
 
+    def on_end(self):
+        self.ring.wake()
+        Log.info("FrameGrabber terminated.")
+
+
+# Frame pre-processor: take the newest frame from the grabber and preprocess the frame
+class FramePreProcessor(ThreadRunnable, BufferPackedResult, RecordFPS):
+    _FRAME_WAIT_TIMEOUT = 0.05
+
+    def __init__(self, settings: DetectSettings):
+        ThreadRunnable.__init__(self)
+        RecordFPS.__init__(self)
         self.pre_process = True
         self.offsetLeft = settings.get_or_set_setting_value('offsetLeft', 0)
         self.offsetRight = settings.get_or_set_setting_value('offsetRight', 0)
@@ -121,6 +439,46 @@ class FramePreProcessor(ThreadRunnable, BufferPackedResult, RecordFPS):
         self._1_norm_min = settings.get_or_set_setting_value("_1_norm_min", 0)
         self._1_norm_max = settings.get_or_set_setting_value("_1_norm_max", 256)
         self._2_contrast = settings.get_or_set_setting_value("_2_contrast", 1.3)
+        # reuse preallocated per-stage output buffers instead of allocating new arrays every frame
+        self.use_frame_pool = settings.get_or_set_setting_value('useFramePool', True)
+        # crop (and optionally scale / convert to gray) in the gstreamer pipeline instead of on the CPU
+        self.gst_hw_crop = settings.get_or_set_setting_value('gstHardwareCrop', False)
+        self.gst_scale = settings.get_or_set_setting_value('gstOutputScale', 1.0)
+        self.gst_gray = settings.get_or_set_setting_value('gstGrayOutput', False)
+        # scale of the cropped frames and frames dropped after each processed one, set by the quality scheduler
+        self.input_scale = settings.get_or_set_setting_value('inputScale', 1.0)
+        self.frame_skip = settings.get_or_set_setting_value('frameSkip', 0)
+        self.frame_counts = {}  # camera id: frames taken from the ring
+
+        # frame source: auto | camera | gstreamer | video | images | synthetic
+        self.source_kind = settings.get_or_set_setting_value('frameSource', 'auto')
+        if self.source_kind == 'auto':
+            if 'Win' in platform.platform() or ('Linux' in platform.platform() and 'x86' in platform.platform()):
+                self.source_kind = 'camera'
+            else:
+                self.source_kind = 'gstreamer'
+        self.source_path = settings.get_or_set_setting_value('frameSourcePath', '')
+        self.source_loop = settings.get_or_set_setting_value('frameSourceLoop', False)
+        self.source_realtime = settings.get_or_set_setting_value('frameSourceRealtime', False)
+        self.use_gstreamer = self.source_kind == 'gstreamer'
+
+        self.sensor_ids = settings.get_or_set_setting_value('cameraSensorIds', [0])
+        self.num_cameras = self.count_cameras(settings)
+        # round_robin: one camera frame per main_body(); batch: the newest frame of every camera per main_body()
+        self.multi_camera_mode = settings.get_or_set_setting_value('multiCameraMode', 'round_robin')
+        BufferPackedResult.__init__(self, max(2, 2 * self.num_cameras))
+        self.frame_pool = FramePool(settings.get_or_set_setting_value('framePoolDepth', 12))
+        # skip detection of frames showing the same scene as the last detected one (line stopped)
+        self.motion_gate = None
+        if settings.get_or_set_setting_value('motionGate', False):
+            self.motion_gate = MotionGate(settings.get_or_set_setting_value('motionGateThreshold', 2.2),
+                                          settings.get_or_set_setting_value('motionGateRefresh', 1.0))
+        self.last_frames = {}  # camera_id: (raw, processed) of the last frame that changed, see process_camera()
+        self.frame_event = threading.Event()
+        ring_size = settings.get_or_set_setting_value('captureRingSize', 4)
+        self.grabbers = [FrameGrabber(self.create_source(cam), ring_size, self.frame_event)
+                         for cam in range(self.num_cameras)]
+        self.next_camera = 0
 
         settings.subscribe_to_value_change('offsetUp', self.set_offset_up)
         settings.subscribe_to_value_change('offsetDown', self.set_offset_down)
@@ -129,11 +487,27 @@ class FramePreProcessor(ThreadRunnable, BufferPackedResult, RecordFPS):
         settings.subscribe_to_value_change("_1_norm_min", self.set_1_norm_min)
         settings.subscribe_to_value_change("_1_norm_max", self.set_1_norm_max)
         settings.subscribe_to_value_change("_2_contrast", self.set_2_contrast)
+        settings.subscribe_to_value_change('inputScale', self.set_input_scale)
+        settings.subscribe_to_value_change('frameSkip', self.set_frame_skip)
         self.settings = settings
+        # strip stitching: stamp every frame with the web position, the detectors only inspect the new fabric
+        self.web_displacement = None
+        if settings.get_or_set_setting_value('stripStitching', False):
+            self.web_displacement = WebDisplacement(settings.get_or_set_setting_value('cvFabricAxis', 0),
+                                                    settings.get_or_set_setting_value('stripDisplacementScale', 0.5))
 
         self.processing_pipe = FunctionPipeline()
         self.init_processing_pipe()
 
+    @staticmethod
+    def count_cameras(settings: DetectSettings) -> int:
+        # one grabber per camera (sensor ids for camera/gstreamer, a list of paths for replay sources)
+        source_kind = settings.get_or_set_setting_value('frameSource', 'auto')
+        if source_kind in ('auto', 'camera', 'gstreamer'):
+            return len(settings.get_or_set_setting_value('cameraSensorIds', [0]))
+        source_path = settings.get_or_set_setting_value('frameSourcePath', '')
+        return len(source_path) if isinstance(source_path, list) else 1
+
     def init_processing_pipe(self):
         # 0
         self.processing_pipe.add_func(color2gray, {})
@@ -145,15 +519,61 @@ class FramePreProcessor(ThreadRunnable, BufferPackedResult, RecordFPS):
     # ------------- Setters
     def set_offset_up(self, v):
         self.offsetUp = v
+        self.on_crop_change()
 
     def set_offset_down(self, v):
         self.offsetDown = v
+        self.on_crop_change()
 
     def set_offset_left(self, v):
         self.offsetLeft = v
+        self.on_crop_change()
 
     def set_offset_right(self, v):
         self.offsetRight = v
+        self.on_crop_change()
+
+    def set_input_scale(self, v):
+        self.input_scale = v
+        self.reset_frame_state()
+
+    def set_frame_skip(self, v):
+        self.frame_skip = v
+
+    def on_crop_change(self):
+        self.reset_frame_state()
+        if self.hw_crop_enabled():
+            self.reopen_sources()
+
+    def reset_frame_state(self):
+        # the frame size changes: buffers and references of the old size are useless
+        self.frame_pool.reset()
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        if self.web_displacement is not None:
+            self.web_displacement.reset()
+
+    def reopen_sources(self):
+        for cam, grabber in enumerate(self.grabbers):
+            grabber.request_reopen(self.create_source(cam))
+
+    def create_source(self, cam=0) -> FrameSource:
+        if self.use_gstreamer:
+            return GStreamerSource(self.build_gstreamer_pipeline(self.sensor_ids[cam]))
+        if self.source_kind == 'camera':
+            return CameraSource(self.sensor_ids[cam])
+        path = self.source_path[cam] if isinstance(self.source_path, list) else self.source_path
+        return create_frame_source(self.source_kind, path, self.source_loop, self.source_realtime)
+
+    def hw_crop_enabled(self):
+        return self.use_gstreamer and self.gst_hw_crop
+
+    def build_gstreamer_pipeline(self, sensor_id=0):
+        if not self.gst_hw_crop:
+            return gstreamer_pipeline(sensor_id=sensor_id)
+        return gstreamer_pipeline(sensor_id=sensor_id, crop_left=int(self.offsetLeft), crop_right=int(self.offsetRight),
+                                  crop_top=int(self.offsetUp), crop_bottom=int(self.offsetDown),
+                                  scale=self.gst_scale, gray=self.gst_gray and self.pre_process)
 
     def set_1_norm_min(self, v):
         self._1_norm_min = v
@@ -167,49 +587,240 @@ class FramePreProcessor(ThreadRunnable, BufferPackedResult, RecordFPS):
         self._2_contrast = v
         self.processing_pipe.update_func_param(2, 'contrast', self._2_contrast)
 
+    def stop_grabbers(self):
+        for grabber in self.grabbers:
+            grabber.thread_stop()
+            if grabber.get_thread().is_alive():
+                grabber.thread_join()
+            grabber.release()
+
     def exit_nicely(self, *args):
         self.thread_stop()
-        self.cap.release()
+        self.stop_grabbers()
         Log.info("FramePreProcessor terminated nicely.")
 
     def on_start(self):
         Log.info("FramePreProcessor started...")
 
+    def start_grabbers(self):
+        for grabber in self.grabbers:
+            if not grabber.get_thread().is_alive():
+                grabber.thread_start()
+
+    def is_capturing(self):
+        # False once every (replay) source is exhausted and all captured frames were taken
+        return any(grabber.loop_run or grabber.ring.has_new() for grabber in self.grabbers)
+
+    def get_capture_fps(self, cam=0):
+        return self.grabbers[cam].get_fps()
+
     def set_pre_process(self, v: bool):
+        changed = self.pre_process != v
         self.pre_process = v
+        if changed and self.motion_gate is not None:
+            # the other detector has no detections of the reference frames
+            self.motion_gate.reset()
+        if changed and self.hw_crop_enabled() and self.gst_gray:
+            # YOLO needs BGR frames, CV mode takes GRAY8 straight from the pipeline
+            self.reopen_sources()
+
+    def wake(self):
+        self.frame_event.set()
+
+    def wait_for_frames(self):
+        self.frame_event.clear()
+        if not any(grabber.ring.has_new() for grabber in self.grabbers):
+            self.frame_event.wait(self._FRAME_WAIT_TIMEOUT)
 
     def main_body(self):
-        ret, frame = self.cap.read()
+        if self.multi_camera_mode == 'batch' and self.num_cameras > 1:
+            self.wait_for_frames()
+            for cam in range(self.num_cameras):
+                self.process_camera(cam)
+            return
+        for attempt in range(2):
+            for _ in range(self.num_cameras):
+                cam = self.next_camera
+                self.next_camera = (cam + 1) % self.num_cameras
+                if self.grabbers[cam].ring.has_new():
+                    self.process_camera(cam)
+                    return
+            if attempt == 0:
+                self.wait_for_frames()
+
+    def process_camera(self, cam: int):
+        ring = self.grabbers[cam].ring
+        ret, _, frame, capture_time = ring.acquire_latest()
+        if ret and not self.pre_process and frame.ndim == 2:
+            # gray frame left over from the CV mode pipeline while it is being rebuilt
+            ring.release()
+            return
+        if ret and self.frame_skip > 0:
+            count = self.frame_counts.get(cam, 0)
+            self.frame_counts[cam] = count + 1
+            if count % (self.frame_skip + 1) != 0:
+                ring.release()
+                return
         if ret:
             self._FPSStartPoint_()
-            packed_result = {'creation_time': time.time()}
-            # pre-processing frame
-            frame_cropped = frame[int(self.offsetUp):int(self.cap_height - self.offsetDown),
-                            int(self.offsetLeft):int(self.cap_width - self.offsetRight)]
+            packed_result = FrameResult(cam, capture_time)
+            # pre-processing frame; the crop is copied out so that the ring slot can be reused right away
+            if self.hw_crop_enabled():
+                roi = frame
+            else:
+                frame_h, frame_w = frame.shape[:2]
+                roi = frame[int(self.offsetUp):int(frame_h - self.offsetDown),
+                            int(self.offsetLeft):int(frame_w - self.offsetRight)]
+            if self.motion_gate is not None:
+                # before any copy: an unchanged frame takes over the frames of the last changed one instead of
+                # going through the crop copy, gray and contrast stages
+                packed_result.unchanged = self.motion_gate.check(cam, roi)
+                packed_result.gate_reference = self.motion_gate.reference_id(cam)
+                if packed_result.unchanged and cam in self.last_frames:
+                    ring.release()
+                    packed_result.raw, packed_result.processed = self.last_frames[cam]
+                    if self.web_displacement is not None:
+                        packed_result.web_position = self.web_displacement.position.get(cam)
+                    self.finish_frame(cam, packed_result)
+                    return
+            if self.input_scale != 1:
+                size = (max(1, round(roi.shape[1] * self.input_scale)), max(1, round(roi.shape[0] * self.input_scale)))
+                frame_cropped = None
+                if self.use_frame_pool:
+                    frame_cropped = self.frame_pool.get(f'raw{cam}', (size[1], size[0]) + roi.shape[2:])
+                frame_cropped = cv.resize(roi, size, dst=frame_cropped, interpolation=cv.INTER_AREA)
+            elif self.use_frame_pool:
+                frame_cropped = self.frame_pool.get(f'raw{cam}', roi.shape)
+                np.copyto(frame_cropped, roi)
+            else:
+                frame_cropped = roi.copy()
+            ring.release()
+            if self.web_displacement is not None:
+                packed_result.web_position = self.web_displacement.update(cam, frame_cropped, capture_time)
             if self.pre_process:
-                processed_frame = self.processing_pipe.execute_pipeline(frame_cropped)
-                packed_result['processed'] = processed_frame
-            self._FPSUpdateFPS_()
-            packed_result['raw'] = frame_cropped
-            packed_result['fps_fpp'] = self.fps
-            self.put(packed_result)
+                if self.use_frame_pool:
+                    h, w = frame_cropped.shape[:2]
+                    # gray is consumed by the contrast stage right away, one buffer is enough
+                    dst_buffers = {0: self.frame_pool.get('gray', (h, w), depth=1),
+                                   2: self.frame_pool.get(f'contrast{cam}', (h, w))}
+                    processed_frame = self.processing_pipe.execute_pipeline(frame_cropped, dst_buffers)
+                else:
+                    processed_frame = self.processing_pipe.execute_pipeline(frame_cropped)
+                packed_result.processed = processed_frame
+            packed_result.raw = frame_cropped
+            if self.motion_gate is not None:
+                self.last_frames[cam] = (packed_result.raw, packed_result.processed)
+            self.finish_frame(cam, packed_result)
+
+    def finish_frame(self, cam: int, packed_result: FrameResult):
+        self._FPSUpdateFPS_()
+        packed_result.fps_fpp = self.fps
+        packed_result.fps_capture = self.get_capture_fps(cam)
+        packed_result.t_preprocess = time.time()
+        self.put(packed_result)
 
     def on_end(self):
         self.thread_stop()
-        self.cap.release()
+        self.stop_grabbers()
         Log.info("FramePreProcessor terminated.")
 
 
-class CVSpotDetector(ThreadRunnable, BufferPackedResult, RecordFPS):
-    def __init__(self, pre_processor: FramePreProcessor, settings: DetectSettings):
+# Result renderer: draw the detections on a copy of the frame, only for results that are displayed or saved
+class ResultRenderer:
+    def __init__(self, pool_depth=12):
+        self.frame_pool = FramePool(pool_depth)
+
+    def render(self, packed_result: FrameResult):
+        if packed_result.overlay is not None:
+            return packed_result.overlay
+        frame = packed_result.processed
+        overlay = self.frame_pool.get('overlay', frame.shape[:2] + (3,))
+        if frame.ndim == 2:
+            cv.cvtColor(frame, cv.COLOR_GRAY2BGR, dst=overlay)
+        else:
+            np.copyto(overlay, frame)
+        detections = packed_result.detections
+        cv_detections = detections[detections['source'] == SOURCE_CV]
+        if len(cv_detections) > 0:
+            keypoints = [cv.KeyPoint(float(d['x']), float(d['y']), float(d['w'])) for d in cv_detections]
+            draw_cv_keypoints_on_frame(keypoints, overlay)
+        yolo_detections = detections[detections['source'] == SOURCE_YOLO]
+        for box, d in zip(to_xyxy(yolo_detections), yolo_detections):
+            plot_one_box(box, overlay, label=f"{YoloV5Detector.categories[int(d['class_id'])]}:{d['score']:.2f}",
+                         line_thickness=1, color=(0, 0, 255))
+        packed_result.overlay = overlay
+        return overlay
+
+
+class FrameConsumer(ThreadRunnable):
+    """
+    Input side of the detectors: as a thread, sleep until the pre-processor (or the SharedRingReceiver standing in
+    for it) delivers a frame instead of spinning on an empty buffer, see the wait-for-input mode of ThreadRunnable.
+    """
+    _INPUT_WAIT_TIMEOUT = 0.1  # sec
+
+    def __init__(self, pre_processor: FramePreProcessor):
         ThreadRunnable.__init__(self)
-        BufferPackedResult.__init__(self)
+        self.pre_processor = pre_processor
+        self.wait_timeout = self._INPUT_WAIT_TIMEOUT
+
+    def wait_for_input(self, timeout: float) -> bool:
+        return self.pre_processor.wait_for_new(timeout)
+
+    def wake(self):
+        self.pre_processor.wake_waiters()
+
+    def take_frames(self) -> list:
+        """
+        return: the waiting frames, up to one per camera (in multi-camera batch mode the pre-processor delivers one
+        frame per camera at once)
+        """
+        packed_results = []
+        for _ in range(self.pre_processor.num_cameras):
+            ret, packed_result = self.pre_processor.get()
+            if not ret:
+                break
+            packed_results.append(packed_result)
+        return packed_results
+
+
+class CVSpotDetector(FrameConsumer, BufferPackedResult, RecordFPS, ReuseUnchangedResult, StitchStrips):
+    DETECTOR_NAME = 'cv'
+    # detector attributes that are set through the parameter queue as well, the others are blob detector params
+    _DETECTOR_ATTRIBUTES = ('engine', 'background_subtraction')
+
+    def __init__(self, pre_processor: FramePreProcessor, settings: DetectSettings):
+        FrameConsumer.__init__(self, pre_processor)
+        BufferPackedResult.__init__(self, max(2, 2 * pre_processor.num_cameras))
         RecordFPS.__init__(self)
+        ReuseUnchangedResult.__init__(self)
+        StitchStrips.__init__(self, settings, 'cvStripMinFraction', 0.)
         self.detectorParam = None
         self.detector = None
-        self.pre_processor = pre_processor
+        # parameter changes come from the settings callbacks (UI thread), they are queued and applied at once by
+        # the detector thread between two frames, once no change came in for param_debounce seconds (or after
+        # param_max_delay while a slider keeps moving)
+        self.param_lock = threading.Lock()
+        self.pending_params = {}  # name: value
+        self.param_version = 0
+        self.applied_param_version = 0
+        self.param_change_time = 0.
+        self.param_pending_since = 0.
+        self.param_debounce = settings.get_or_set_setting_value('cvParamDebounce', 0.1)
+        self.param_max_delay = settings.get_or_set_setting_value('cvParamMaxDelay', 0.5)
+        # blob: cv.SimpleBlobDetector, components: one threshold + connected components (ComponentSpotDetector)
+        self.engine = settings.get_or_set_setting_value('cvEngine', 'blob')
+        self.component_detector = ComponentSpotDetector(
+            mode=settings.get_or_set_setting_value('cvThresholdMode', 'fixed'),
+            block_size=settings.get_or_set_setting_value('cvAdaptiveBlockSize', 51),
+            adaptive_c=settings.get_or_set_setting_value('cvAdaptiveC', 10))
 
         self.settings = settings
+        # patterned fabric: detect blobs on the residual of a learned pattern model instead of the frame itself
+        self.background_subtraction = settings.get_or_set_setting_value('cvBackgroundSubtraction', False)
+        self.background_models = {}  # camera id: PatternBackgroundModel
+        settings.subscribe_to_value_change('cvBackgroundSubtraction', self.set_background_subtraction)
+        settings.subscribe_to_value_change('cvEngine', self.set_engine)
         self.prepare_blob_detector_params()
         self.update_detector()
         settings.subscribe_to_value_change('minArea', self.set_min_area)
@@ -218,29 +829,87 @@ class CVSpotDetector(ThreadRunnable, BufferPackedResult, RecordFPS):
         settings.subscribe_to_value_change('maxThreshold', self.set_max_threshold)
         self.settings.subscribe_to_value_change('sensitivity', self.set_sensitivity)
         self.set_sensitivity(self.settings.get_or_set_setting_value('sensitivity', 500))
+        self.apply_pending_params(force=True)
 
     def set_sensitivity(self, v):
         self.set_max_threshold(int((v / 1000) * 255))
 
     # setter
     def set_min_area(self, value):
-        self.detectorParam.minArea = value
-        self.update_detector()
+        self.queue_param('minArea', value)
 
     def set_max_area(self, value):
-        self.detectorParam.maxArea = value
-        self.update_detector()
+        self.queue_param('maxArea', value)
 
     def set_min_threshold(self, value):
-        self.detectorParam.minThreshold = value
-        self.update_detector()
+        self.queue_param('minThreshold', value)
 
     def set_max_threshold(self, value):
-        self.detectorParam.maxThreshold = value
+        self.queue_param('maxThreshold', value)
+
+    def set_background_subtraction(self, v: bool):
+        self.queue_param('background_subtraction', v)
+
+    def set_engine(self, v: str):
+        self.queue_param('engine', v)
+
+    def queue_param(self, name: str, value):
+        with self.param_lock:
+            now = time.time()
+            if len(self.pending_params) == 0:
+                self.param_pending_since = now
+            self.pending_params[name] = value
+            self.param_change_time = now
+            self.param_version += 1
+
+    def apply_pending_params(self, force=False):
+        """
+        Detector thread, between frames: apply the queued parameter changes at once and rebuild the detector.
+        """
+        if self.param_version == self.applied_param_version:
+            return
+        now = time.time()
+        if not force and now - self.param_change_time < self.param_debounce and \
+                now - self.param_pending_since < self.param_max_delay:
+            return
+        with self.param_lock:
+            pending, self.pending_params = self.pending_params, {}
+            version = self.param_version
+        for name, value in pending.items():
+            if name in self._DETECTOR_ATTRIBUTES:
+                setattr(self, name, value)
+            else:
+                setattr(self.detectorParam, name, value)
+        if 'background_subtraction' in pending:
+            self.background_models = {}
+        # detections of the old parameters are not reused for unchanged frames
+        self.last_detections = {}
         self.update_detector()
+        self.applied_param_version = version
 
     def update_detector(self):
-        self.detector = cv.SimpleBlobDetector_create(self.detectorParam)
+        if self.engine == 'components':
+            self.update_component_detector()
+        else:
+            self.detector = cv.SimpleBlobDetector_create(self.detectorParam)
+
+    def update_component_detector(self):
+        # the residual of the background model holds bright spots
+        self.component_detector.match_blob_params(self.detectorParam,
+                                                  'bright' if self.background_subtraction else 'dark')
+
+    def get_background_model(self, cam: int) -> PatternBackgroundModel:
+        model = self.background_models.get(cam)
+        if model is None:
+            settings = self.settings
+            model = PatternBackgroundModel(axis=settings.get_or_set_setting_value('cvFabricAxis', 0),
+                                           min_period=settings.get_or_set_setting_value('cvPatternMinPeriod', 8),
+                                           max_period=settings.get_or_set_setting_value('cvPatternMaxPeriod', 256),
+                                           learning_rate=settings.get_or_set_setting_value('cvPatternLearningRate',
+                                                                                           0.05),
+                                           noise_sigma=settings.get_or_set_setting_value('cvResidualNoiseSigma', 3.))
+            self.background_models[cam] = model
+        return model
 
     def prepare_blob_detector_params(self):
         if self.detectorParam is None:
@@ -288,42 +957,64 @@ class CVSpotDetector(ThreadRunnable, BufferPackedResult, RecordFPS):
     def on_start(self):
         Log.info("CVSpotDetector started...")
 
-    @staticmethod
-    def convert_keypoints_to_labels(keypoints, frame):
-        h, w, _ = frame.shape
-        labels = []
-        for kp in keypoints:
-            x = kp.pt[0]
-            y = kp.pt[1]
-            size = kp.size / 2 + 2
-            labels.append(f"{x / w} {y / h} {size / w} {size / y}")
-        return labels
-
     def main_body(self):
-        ret, packed_result = self.pre_processor.get()
-        if ret:
-            self._FPSStartPoint_()
-            keypoints = self.detector.detect(packed_result['processed'])
-            self._FPSUpdateFPS_()
-            packed_result['keypoints'] = keypoints
-            packed_result['labels'] = self.convert_keypoints_to_labels(keypoints, packed_result['raw'])
-            packed_result['processed'] = draw_cv_keypoints_on_frame(keypoints, packed_result['processed'])
-            packed_result['num_spots'] = len(keypoints)
-            packed_result['detector_fps'] = self.fps
-            self.put(packed_result)
+        self.apply_pending_params()
+        for packed_result in self.plan_strips(self.reuse_unchanged(self.take_frames())):
+            self.detect(packed_result)
+
+    def detect(self, packed_result: FrameResult):
+        self._FPSStartPoint_()
+        detections = self.find_spots(packed_result.processed, packed_result.camera_id,
+                                     self.strip_window(packed_result))
+        self._FPSUpdateFPS_()
+        self.finish(packed_result, detections)
+
+    def finish(self, packed_result: FrameResult, detections: np.ndarray):
+        packed_result.detector = 'cv'
+        packed_result.detections = self.stitch(packed_result, detections)
+        packed_result.num_spots = len(packed_result.detections)
+        packed_result.detector_fps = self.fps
+        packed_result.t_detect = time.time()
+        self.remember_detections(packed_result)
+        self.put(packed_result)
+
+    def finish_carried(self, packed_results: list):
+        for packed_result in packed_results:
+            self.finish(packed_result, empty_detections())
+
+    def find_spots(self, image: np.ndarray, cam=0, window: tuple = None) -> np.ndarray:
+        """
+        param: window: (start, stop) lines along the web to search (strip stitching), None: the whole frame
+        """
+        if self.background_subtraction:
+            # the model learns from whole frames
+            image = self.get_background_model(cam).subtract(image)
+        if window is not None:
+            image = image[window[0]:window[1]] if self.strip_axis == 0 else image[:, window[0]:window[1]]
+        if self.engine == 'components':
+            detections = self.component_detector.detect(image)
+        else:
+            detections = detections_from_keypoints(self.detector.detect(image))
+        if window is not None:
+            detections['y' if self.strip_axis == 0 else 'x'] += window[0]
+        return detections
 
     def on_end(self):
         self.thread_stop()
         Log.info("CVSpotDetector terminated!")
 
 
-class YoloV5Detector(ThreadRunnable, BufferPackedResult, RecordFPS):
+class YoloV5Detector(FrameConsumer, BufferPackedResult, RecordFPS, ReuseUnchangedResult, StitchStrips):
     categories = ["NG"]
+    DETECTOR_NAME = 'yolo'
 
     def __init__(self, pre_processor: FramePreProcessor, settings: DetectSettings):
-        ThreadRunnable.__init__(self)
-        BufferPackedResult.__init__(self)
+        FrameConsumer.__init__(self, pre_processor)
+        BufferPackedResult.__init__(self, max(2, 2 * pre_processor.num_cameras))
         RecordFPS.__init__(self)
+        ReuseUnchangedResult.__init__(self)
+        # an inference costs the same for a strip as for the whole frame: wait for more new fabric
+        StitchStrips.__init__(self, settings, 'yoloStripMinFraction', 0.5)
         plugin_library = "./res/Jetson_nano/libmyplugins.so"
         # TODO: check updated engine file
         dl_engines = get_all_files(ContinuousLearner.LOCAL_WEIGHTS_PATH)
@@ -341,12 +1032,32 @@ class YoloV5Detector(ThreadRunnable, BufferPackedResult, RecordFPS):
             plugin_library = "./res/Linux_x86_RTX3090/libmyplugins.so"
             engine_file_path = "./res/Linux_x86_RTX3090/mixed_nb811.engine"
         ctypes.CDLL(plugin_library)
-        self.pre_processor = pre_processor
         self.settings = settings
+        # imported here, pycuda.autoinit creates a CUDA context in every process importing Yolov5TRT (the spawned
+        # pre-processor and CV workers must not have one)
+        from Yolov5TRT import Yolov5TRT
         # noinspection PyUnboundLocalVariable
         self.yolov5_wrapper = Yolov5TRT(engine_file_path=engine_file_path, categories=self.categories)
-
+        # number of batches in flight on the GPU, < 2 runs inference synchronously
+        pipeline_depth = self.settings.get_or_set_setting_value('yoloPipelineDepth', 0)
+        self.pipelined = pipeline_depth > 1
+        if self.pipelined:
+            self.yolov5_wrapper.init_async_slots(pipeline_depth)
+
+        self.yolov5_wrapper.set_nms_method(self.settings.get_or_set_setting_value('yoloNmsMethod', 'matrix'))
+        # tiled inference at native resolution for small spots: more tiles -> more GPU time, better recall
+        self.tiled = self.settings.get_or_set_setting_value('yoloTiling', False)
+        self.tile_size = self.settings.get_or_set_setting_value('yoloTileSize', None)  # (w, h), None: engine input
+        self.tile_overlap = self.settings.get_or_set_setting_value('yoloTileOverlap', 32)
+        if self.tiled and self.pipelined:
+            Log.warning("YOLO tiling runs synchronously, yoloPipelineDepth is ignored while tiling.")
+        # cascade mode: a CVSpotDetector screens every frame, only the windows around the candidates go to the
+        # engine, at native resolution (engine input size, with tiling the tile size)
+        self.screener = None
+        self.cascade_frames = 0
+        self.cascade_confirmed = 0
         self.settings.subscribe_to_value_change('sensitivity', self.set_sensitivity)
+        self.settings.subscribe_to_value_change('yoloTiling', self.set_tiling)
         self.set_sensitivity(self.settings.get_or_set_setting_value('sensitivity', 500))
 
     def set_sensitivity(self, v):
@@ -355,6 +1066,48 @@ class YoloV5Detector(ThreadRunnable, BufferPackedResult, RecordFPS):
         """
         self.yolov5_wrapper.set_conf_thresh(1 - v / 1000)
 
+    def set_tiling(self, v: bool):
+        self.tiled = v
+
+    def set_screener(self, screener: typing.Optional[CVSpotDetector]):
+        self.screener = screener
+        # detections remembered for unchanged frames were made with / without the screener
+        self.last_detections = {}
+
+    def screen(self, packed_results: list) -> list:
+        """
+        Cascade mode: run the screener on every frame, the frames without candidates are done right away.
+        return: the frames with candidates
+        """
+        self.screener.apply_pending_params()
+        with_candidates = []
+        clean = []
+        for packed_result in packed_results:
+            packed_result.candidates = self.screener.find_spots(packed_result.processed, packed_result.camera_id,
+                                                                self.strip_window(packed_result))
+            if len(packed_result.candidates) > 0:
+                self.ensure_bgr(packed_result)
+                with_candidates.append(packed_result)
+            else:
+                clean.append(packed_result)
+        self.cascade_frames += len(packed_results)
+        self.cascade_confirmed += len(with_candidates)
+        if len(clean) > 0:
+            self.finish_batch(clean, [(np.array([]), np.array([]), np.array([]))] * len(clean), 0)
+        return with_candidates
+
+    @staticmethod
+    def ensure_bgr(packed_result: FrameResult):
+        if packed_result.raw.ndim == 2:
+            # gray frame straight from the capture pipeline (CV mode), the engine takes BGR
+            packed_result.raw = cv.cvtColor(packed_result.raw, cv.COLOR_GRAY2BGR)
+
+    def gpu_frame_rate(self) -> float:
+        """
+        return: fraction of the screened frames that went to the engine
+        """
+        return self.cascade_confirmed / self.cascade_frames if self.cascade_frames > 0 else 1.
+
     def exit_nicely(self, *args):
         self.thread_stop()
         Log.info("YoloV5Detector terminated nicely!")
@@ -362,31 +1115,198 @@ class YoloV5Detector(ThreadRunnable, BufferPackedResult, RecordFPS):
     def on_start(self):
         Log.info("YoloV5Detector started...")
 
-    @staticmethod
-    def convert_keypoints_to_labels(keypoints, frame):
-        labels = []
-        h, w, _ = frame.shape
-        for kp in keypoints:
-            kw = kp[2] - kp[0]
-            kh = kp[3] - kp[1]
-            x = kp[0] + kw / 2
-            y = kp[1] + kh / 2
-            labels.append(f"{x / w} {y / h} {kw / w} {kh / h}")
-        return labels
+    def wait_for_input(self, timeout: float) -> bool:
+        # batches still on the GPU have to be collected even without new frames
+        if self.pipelined and self.yolov5_wrapper.num_pending() > 0:
+            return True
+        return FrameConsumer.wait_for_input(self, timeout)
 
     def main_body(self):
-        ret, packed_result = self.pre_processor.get()
+        # the frames of all cameras go through the engine as one batch
+        packed_results = self.plan_strips(self.reuse_unchanged(self.take_frames()))
+        if self.screener is not None:
+            packed_results = self.screen(packed_results)
+        if self.pipelined and not self.tiled and self.screener is None:
+            self.pipeline_step(packed_results)
+            return
+        # tiling or the cascade was switched on: collect the batches still on the GPU first
+        self.flush()
+        if len(packed_results) > 0:
+            self.detect_batch(packed_results)
+
+    def detect(self, packed_result: FrameResult):
+        self.detect_batch([packed_result])
+
+    def detect_batch(self, packed_results: list):
+        self._FPSStartPoint_()
+        batch_results, inference_time = self.infer(packed_results)
+        self._FPSUpdateFPS_()
+        self.finish_batch(packed_results, batch_results, inference_time)
+
+    def infer(self, packed_results: list):
+        """
+        Synchronous inference of the frames (tiled / around the candidates depending on the mode).
+        return: batch_results, inference_time
+        """
+        raw_images = [packed_result.raw for packed_result in packed_results]
+        if self.screener is not None:
+            tile_w, tile_h = (self.tile_size if self.tiled else None) or (None, None)
+            windows = [self.yolov5_wrapper.candidate_windows(raw.shape[0], raw.shape[1],
+                                                             np.column_stack((packed_result.candidates['x'],
+                                                                              packed_result.candidates['y'])),
+                                                             tile_w, tile_h, self.tile_overlap // 2)
+                       for raw, packed_result in zip(raw_images, packed_results)]
+            batch_results, inference_time = self.yolov5_wrapper.inference_windows(raw_images, windows)
+        elif self.tiled:
+            batch_results, inference_time = self.yolov5_wrapper.inference_tiled(raw_images, self.tile_size,
+                                                                                self.tile_overlap)
+        else:
+            batch_results, inference_time = self.yolov5_wrapper.inference_batch(raw_images)
+        return batch_results, inference_time
+
+    def pipeline_step(self, packed_results: list):
+        """
+        Submit new frames without waiting for the GPU and collect whatever finished, so that preprocessing of the
+        next frame, GPU execution and NMS of the previous frame overlap.
+        """
+        wrapper = self.yolov5_wrapper
+        for i in range(0, len(packed_results), wrapper.batch_size):
+            chunk = packed_results[i:i + wrapper.batch_size]
+            if not wrapper.can_submit():
+                self.finish_pipelined(*wrapper.poll(block=True))
+            wrapper.submit([packed_result.raw for packed_result in chunk], tag=chunk)
+        # nothing new to submit: wait for the GPU rather than polling it in a loop
+        self.finish_pipelined(*wrapper.poll(block=len(packed_results) == 0))
+
+    def flush(self):
+        """
+        Finish the batches still on the GPU, e.g. before the mode changes and this detector is no longer run.
+        """
+        while self.pipelined and self.yolov5_wrapper.num_pending() > 0:
+            self.finish_pipelined(*self.yolov5_wrapper.poll(block=True))
+
+    def finish_pipelined(self, ret, packed_results, batch_results, inference_time):
         if ret:
-            self._FPSStartPoint_()
-            packed_result['processed'] = packed_result['raw'].copy()
-            packed_result['processed'], packed_result['inference_time'], packed_result['num_spots'], packed_result[
-                'keypoints'] = self.yolov5_wrapper.inference(packed_result['processed'])
-            packed_result['labels'] = self.convert_keypoints_to_labels(packed_result['keypoints'], packed_result['raw'])
+            # throughput: time between two finished batches
             self._FPSUpdateFPS_()
-            packed_result['detector_fps'] = self.fps
+            self._FPSStartPoint_()
+            self.finish_batch(packed_results, batch_results, inference_time)
+
+    def finish_batch(self, packed_results: list, batch_results: list, inference_time):
+        detect_time = time.time()
+        for packed_result, (result_boxes, result_scores, result_classid) in zip(packed_results, batch_results):
+            # detections only, boxes are drawn by ResultRenderer for the frames that are displayed or saved
+            packed_result.detector = 'yolo'
+            packed_result.processed = packed_result.raw
+            packed_result.inference_time = inference_time
+            packed_result.detections = self.stitch(packed_result,
+                                                   detections_from_boxes(result_boxes, result_scores, result_classid))
+            packed_result.num_spots = len(packed_result.detections)
+            packed_result.detector_fps = self.fps
+            packed_result.t_detect = detect_time
+            self.remember_detections(packed_result)
             self.put(packed_result)
 
+    def finish_carried(self, packed_results: list):
+        self.finish_batch(packed_results, [(np.array([]), np.array([]), np.array([]))] * len(packed_results), 0)
+
     def on_end(self):
         self.thread_stop()
         self.yolov5_wrapper.destroy()
         Log.info("YoloV5Detector terminated!")
+
+
+class FusedDetector(FrameConsumer, BufferPackedResult, RecordFPS, ReuseUnchangedResult, StitchStrips):
+    """
+    Fused mode: every frame goes through both detectors, CVSpotDetector on a worker thread (CPU) while
+    YoloV5Detector runs the engine (GPU) on this one, and their detections are merged (fuse_detections()).
+    OpenCV and TensorRT release the GIL, so a frame costs about the slower of the two detectors.
+    """
+    DETECTOR_NAME = 'fused'
+
+    def __init__(self, pre_processor: FramePreProcessor, settings: DetectSettings, cv_detector: CVSpotDetector,
+                 yolo_detector: YoloV5Detector):
+        FrameConsumer.__init__(self, pre_processor)
+        BufferPackedResult.__init__(self, max(2, 2 * pre_processor.num_cameras))
+        RecordFPS.__init__(self)
+        ReuseUnchangedResult.__init__(self)
+        StitchStrips.__init__(self, settings, 'yoloStripMinFraction', 0.5)
+        self.settings = settings
+        self.cv_detector = cv_detector
+        self.yolo_detector = yolo_detector
+        self.cv_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='FusedCV')
+        # union | both | vote, see fuse_detections()
+        self.rule = settings.get_or_set_setting_value('fusionRule', 'union')
+        self.iou_thres = settings.get_or_set_setting_value('fusionIou', 0.1)
+        self.cv_weight = settings.get_or_set_setting_value('fusionCvWeight', 0.5)
+        self.yolo_weight = settings.get_or_set_setting_value('fusionYoloWeight', 0.5)
+        self.min_score = settings.get_or_set_setting_value('fusionMinScore', 0.6)
+        settings.subscribe_to_value_change('fusionRule', self.set_rule)
+
+    def set_rule(self, v: str):
+        self.rule = v
+        self.last_detections = {}
+
+    def exit_nicely(self, *args):
+        self.thread_stop()
+        Log.info("FusedDetector terminated nicely!")
+
+    def on_start(self):
+        Log.info("FusedDetector started...")
+
+    def main_body(self):
+        packed_results = self.plan_strips(self.reuse_unchanged(self.take_frames()))
+        if len(packed_results) > 0:
+            self.detect_batch(packed_results)
+
+    def detect(self, packed_result: FrameResult):
+        self.detect_batch([packed_result])
+
+    def detect_cv(self, packed_results: list):
+        start = time.time()
+        self.cv_detector.apply_pending_params()
+        detections = [self.cv_detector.find_spots(packed_result.processed, packed_result.camera_id,
+                                                  self.strip_window(packed_result))
+                      for packed_result in packed_results]
+        return detections, (time.time() - start) * 1000
+
+    def detect_batch(self, packed_results: list):
+        self._FPSStartPoint_()
+        cv_future = self.cv_pool.submit(self.detect_cv, packed_results)
+        start = time.time()
+        for packed_result in packed_results:
+            self.yolo_detector.ensure_bgr(packed_result)
+        batch_results, inference_time = self.yolo_detector.infer(packed_results)
+        yolo_latency = (time.time() - start) * 1000
+        cv_results, cv_latency = cv_future.result()
+        self._FPSUpdateFPS_()
+        detect_time = time.time()
+        for packed_result, cv_detections, (result_boxes, result_scores, result_classid) in \
+                zip(packed_results, cv_results, batch_results):
+            yolo_detections = detections_from_boxes(result_boxes, result_scores, result_classid)
+            packed_result.inference_time = inference_time
+            packed_result.detector_latency = {'cv': cv_latency, 'yolo': yolo_latency}
+            self.finish(packed_result, fuse_detections(cv_detections, yolo_detections, self.rule, self.iou_thres,
+                                                       self.cv_weight, self.yolo_weight, self.min_score), detect_time)
+
+    def finish(self, packed_result: FrameResult, detections: np.ndarray, detect_time: float):
+        packed_result.detector = self.DETECTOR_NAME
+        # CV spots and YOLO boxes are both drawn on the color frame
+        packed_result.processed = packed_result.raw
+        packed_result.detections = self.stitch(packed_result, detections)
+        packed_result.num_spots = len(packed_result.detections)
+        packed_result.detector_fps = self.fps
+        packed_result.t_detect = detect_time
+        self.remember_detections(packed_result)
+        self.put(packed_result)
+
+    def finish_carried(self, packed_results: list):
+        detect_time = time.time()
+        for packed_result in packed_results:
+            self.yolo_detector.ensure_bgr(packed_result)
+            self.finish(packed_result, empty_detections(), detect_time)
+
+    def on_end(self):
+        self.thread_stop()
+        self.cv_pool.shutdown(wait=True)
+        Log.info("FusedDetector terminated!")
@@ -10,11 +10,17 @@ import DetectorUI as UI
 from AlarmHandler import AlarmHandler
 from ContinuousLearner import ContinuousLearner
 from CustomUI import DataCollectionDialog
-from Detector import DetectSettings, BufferPackedResult, FramePreProcessor, YoloV5Detector, CVSpotDetector
-from GPIOHandler import GPIOHandler
+from Detector import DetectSettings, BufferPackedResult, FramePreProcessor, YoloV5Detector, CVSpotDetector, \
+    FusedDetector, ResultRenderer, FrameResult
+from DetectorProcesses import ProcessPipeline
+from GPIOHandler import GPIOHandler, SIGNAL_PIN
 from GoogleDriveResultHandler import *
 # Adapt 4k Monitor
 from PowerManager import PowerManager
+from libs.Detections import to_yolo_labels
+from libs.ImageProcessingFunctions import stack_images
+from libs.QualityScheduler import QualityScheduler, OperatingPoint
+from libs.SpotTracker import SpotTracker, SpotTrack
 
 _IS_JETSON_NANO = 'Win' in platform.platform() or ('Linux' in platform.platform() and 'x86' in platform.platform())
 if _IS_JETSON_NANO:
@@ -29,52 +35,206 @@ _sufficient_ram_for_ai = True  # Limit 2GB nano?
 
 class FrameProcessingEngine(QThread, BufferPackedResult):
     sig_source = pyqtSignal(QImage)
+    sig_mode = pyqtSignal(int)  # the quality scheduler switched the detection mode, index of _MODES
+    _MODES = ('cv', 'yolo', 'cascade', 'fused')  # order of comboBox_mode
+    # best quality first, see QualityScheduler.py
+    _DEFAULT_QUALITY_POINTS = [{'name': 'AI tiled', 'mode': 'yolo', 'tiling': True},
+                               {'name': 'AI', 'mode': 'yolo'},
+                               {'name': 'CV + AI cascade', 'mode': 'cascade'},
+                               {'name': 'CV', 'mode': 'cv'},
+                               {'name': 'CV, every 2nd frame', 'mode': 'cv', 'frame_skip': 1},
+                               {'name': 'CV 3/4 scale, every 2nd frame', 'mode': 'cv', 'input_scale': 0.75,
+                                'frame_skip': 1}]
 
     def __init__(self, settings: DetectSettings):
         QThread.__init__(self)
-        BufferPackedResult.__init__(self)
         self.thread_run = True
         self.settings = settings
-        self.frame_processor = FramePreProcessor(self.settings)
-        self.cv_detector = CVSpotDetector(self.frame_processor, self.settings)
-        if _sufficient_ram_for_ai:
-            self.yolo_detector = YoloV5Detector(self.frame_processor, self.settings)
-        else:
-            self.yolo_detector = None
-        self.cv_detector.thread_stop()
-        self.yolo_detector.thread_stop()
-        self.detector = self.cv_detector
+        self.with_yolo = _sufficient_ram_for_ai
+        # optionally run the pre-processor and the detectors in worker processes (DetectorProcesses.py)
+        self.pipeline = None
+        if self.settings.get_or_set_setting_value('multiProcess', False):
+            if ProcessPipeline.is_supported():
+                self.num_cameras = FramePreProcessor.count_cameras(self.settings)
+                self.pipeline = ProcessPipeline(self.settings, self.num_cameras, with_yolo=self.with_yolo)
+            else:
+                Log.error("multiProcess requires Python 3.8+ (multiprocessing.shared_memory), running in one process.")
+        if self.pipeline is None:
+            self.frame_processor = FramePreProcessor(self.settings)
+            self.num_cameras = self.frame_processor.num_cameras
+            self.cv_detector = CVSpotDetector(self.frame_processor, self.settings)
+            if _sufficient_ram_for_ai:
+                self.yolo_detector = YoloV5Detector(self.frame_processor, self.settings)
+                self.fused_detector = FusedDetector(self.frame_processor, self.settings, self.cv_detector,
+                                                    self.yolo_detector)
+            else:
+                self.yolo_detector = None
+                self.fused_detector = None
+            self.cv_detector.thread_stop()
+            if self.yolo_detector is not None:
+                self.yolo_detector.thread_stop()
+                self.fused_detector.thread_stop()
+            self.detector = self.cv_detector
+        BufferPackedResult.__init__(self, max(2, 2 * self.num_cameras))
         self.update_timer = time.time()
+        self.camera_timers = {}  # camera_id: time of the last result of the camera
+        self.renderer = ResultRenderer(self.settings.get_or_set_setting_value('framePoolDepth', 12))
+        self.display_frames = {}  # camera_id: last processed frame of the camera
+        # adaptive quality: switch between operating points to hold qualityTargetFps instead of a fixed mode
+        self.scheduler = None
+        self.scheduler_suspended = False  # the operator selected a mode without operating points
+        self.quality_seed_mode = None  # mode selected in the UI, applied to the scheduler with the next result
+        if self.settings.get_or_set_setting_value('qualityScheduler', False):
+            points = [OperatingPoint(**point) for point in
+                      self.settings.get_or_set_setting_value('qualityPoints', self._DEFAULT_QUALITY_POINTS)]
+            if not self.with_yolo:
+                points = [point for point in points if point.mode == 'cv']
+            if len(points) > 0:
+                self.scheduler = QualityScheduler(
+                    points, self.settings.get_or_set_setting_value('qualityTargetFps', 10.),
+                    max_latency=self.settings.get_or_set_setting_value('qualityMaxLatency', 0.),
+                    window=self.settings.get_or_set_setting_value('qualityWindow', 3.),
+                    upgrade_delay=self.settings.get_or_set_setting_value('qualityUpgradeDelay', 30.))
+            else:
+                Log.error("qualityScheduler needs at least one operating point that can run here.")
 
     def use_yolo(self):
-        if _sufficient_ram_for_ai:
-            self.detector = self.yolo_detector
-            self.frame_processor.set_pre_process(False)
+        if not _sufficient_ram_for_ai:
+            return
+        if self.pipeline is not None:
+            self.pipeline.set_mode('yolo')
+            return
+        self.yolo_detector.set_screener(None)
+        self.detector = self.yolo_detector
+        self.frame_processor.set_pre_process(False)
+
+    def use_cascade(self):
+        # the CV detector screens every frame, YOLO only confirms the frames with candidates
+        if not _sufficient_ram_for_ai:
+            return
+        if self.pipeline is not None:
+            self.pipeline.set_mode('cascade')
+            return
+        self.yolo_detector.set_screener(self.cv_detector)
+        self.detector = self.yolo_detector
+        self.frame_processor.set_pre_process(True)
+
+    def use_fused(self):
+        # both detectors on every frame, CV on a worker thread while YOLO runs on the GPU
+        if not _sufficient_ram_for_ai:
+            return
+        if self.pipeline is not None:
+            self.pipeline.set_mode('fused')
+            return
+        self.yolo_detector.set_screener(None)
+        self.detector = self.fused_detector
+        self.frame_processor.set_pre_process(True)
 
     def use_cv(self):
+        if self.pipeline is not None:
+            self.pipeline.set_mode('cv')
+            return
         self.detector = self.cv_detector
         self.frame_processor.set_pre_process(True)
 
+    def apply_operating_point(self, point: OperatingPoint):
+        getattr(self, f'use_{point.mode}')()
+        # the UI shows the mode and saves it, the scheduler starts from the best point of that mode after a restart
+        self.sig_mode.emit(self._MODES.index(point.mode))
+        for setting_name, value in (('inputScale', point.input_scale), ('yoloTiling', point.tiling),
+                                    ('frameSkip', point.frame_skip)):
+            # not saved, the operator's values stay in the config file
+            self.settings.override_setting_value(setting_name, value)
+            if self.pipeline is not None:
+                self.pipeline.forward_setting(setting_name, value)
+
+    def reseed_quality(self, mode: int):
+        # called from the UI thread, the scheduler is only touched by this thread
+        self.quality_seed_mode = mode
+
+    def seed_quality(self, mode: int, now: float):
+        """
+        Start the scheduler from the best point of the mode (index of _MODES), suspend it if the mode has none.
+        """
+        self.quality_seed_mode = None
+        mode = self._MODES[mode] if self.with_yolo else 'cv'
+        index = self.scheduler.find_mode(mode)
+        self.scheduler_suspended = index is None
+        if self.scheduler_suspended:
+            Log.info(f"Quality scheduler: suspended, no operating point of the {mode} mode.")
+            return
+        self.scheduler.seed(index, now)
+        Log.info(f"Quality scheduler: starting with {self.scheduler.current()}, "
+                 f"target {self.scheduler.target_fps} FPS.")
+        self.apply_operating_point(self.scheduler.current())
+
+    def schedule_quality(self, result: FrameResult, now: float):
+        if self.quality_seed_mode is not None:
+            self.seed_quality(self.quality_seed_mode, now)
+        if self.scheduler_suspended:
+            return
+        self.scheduler.observe(result.camera_id, result.stage_latencies(), result.coverage, result.fps_capture)
+        old_point = self.scheduler.current()
+        switched = self.scheduler.update(now)
+        if switched is None:
+            return
+        reason, stats = switched
+        Log.warning(f"Quality scheduler: {old_point.name} -> {self.scheduler.current()}, {reason}. "
+                    f"Latency per stage: " + ", ".join(f"{stage} {round(latency, 1)} ms"
+                                                       for stage, latency in stats['latencies'].items()))
+        self.apply_operating_point(self.scheduler.current())
+
     def run(self) -> None:
+        if self.scheduler is not None:
+            self.seed_quality(self.settings.get_or_set_setting_value('mode', 0), time.time())
+        if self.pipeline is not None:
+            self.pipeline.start()
+            while self.thread_run and not self.pipeline.finished:
+                ret, result = self.pipeline.get(timeout=0.1)
+                if ret:
+                    self.on_result(result)
+            return
+        # frames are decoded on the grabber threads so that capture overlaps with detection
+        self.frame_processor.start_grabbers()
         while self.thread_run:
-            # capturing frame must be done in QThread or fps will drop significantly
             self.frame_processor.main_body()
 
             self.detector.main_body()
             ret, result = self.detector.get()
-
-            if ret:
-                frame = result['processed']
-                # info_str = f"DFPS: {round(result['detector_fps'])}, UFPS: {round(1 / (time.time() - result['creation_time']), 2)};"
-                # info_str += f'NumSpots: {result["num_spots"]};'
-                # info_str += f'ComT: {round((time.time() - result["creation_time"]) * 1000, 2)} ms;'
-                # frame = add_text_to_frame(frame, info_str)
-                self.sig_source.emit(cvt_cv_to_qt(frame))
-                self.put(result)
-                self.update_timer = time.time()
+            while ret:
+                self.on_result(result)
+                ret, result = self.detector.get()
+
+    def on_result(self, result: FrameResult):
+        cam = result.camera_id
+        now = time.time()
+        result.camera_fps = 1 / (now - self.camera_timers[cam]) if cam in self.camera_timers else -1
+        self.camera_timers[cam] = now
+        # results dropped on the way are never drawn, only the ones shown (and saved from here on)
+        frame = self.renderer.render(result)
+        # info_str = f"DFPS: {round(result.detector_fps)}, UFPS: {round(1 / (time.time() - result.t_capture), 2)};"
+        # info_str += f'NumSpots: {result.num_spots};'
+        # info_str += f'ComT: {round((time.time() - result.t_capture) * 1000, 2)} ms;'
+        # frame = add_text_to_frame(frame, info_str)
+        if self.num_cameras > 1:
+            # show the cameras side by side
+            self.display_frames[cam] = frame
+            frame = stack_images(1 / len(self.display_frames),
+                                 [self.display_frames[c] for c in sorted(self.display_frames)])
+        result.t_postprocess = time.time()
+        if self.scheduler is not None:
+            self.schedule_quality(result, now)
+        self.sig_source.emit(cvt_cv_to_qt(frame))
+        self.put(result)
+        self.update_timer = now
 
     def stop(self):
         self.thread_run = False
+        self.wake_waiters()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.quit()
+            return
         self.frame_processor.thread_stop()
         self.frame_processor.on_end()
 
@@ -82,6 +242,8 @@ class FrameProcessingEngine(QThread, BufferPackedResult):
         self.cv_detector.on_end()
 
         if _sufficient_ram_for_ai:
+            self.fused_detector.thread_stop()
+            self.fused_detector.on_end()
             self.yolo_detector.thread_stop()
             self.yolo_detector.on_end()
         self.quit()
@@ -110,9 +272,14 @@ class DetectorApp(UI.Ui_MainWindow, BufferPackedResult):
 
         self.settings = DetectSettings(self._DETECTOR_CONFIG_FILE)
 
-        self.spot_frame_cnt = 0
-        self.spot_frame_timer = 0
+        self.spot_trackers = {}  # camera_id: SpotTracker, one alarm and one saved image per spot
+        self.spot_track_images = {}  # (camera_id, track_id): (saved image path, payload it was saved from)
         self.gpio = GPIOHandler()
+        # camera_id: GPIO pin of the line-stop signal of the camera's station, SIGNAL_PIN by default
+        self.camera_signal_pins = self.settings.get_or_set_setting_value('cameraSignalPins', {})
+        for pin in set(self.camera_signal_pins.values()):
+            self.gpio.setup_output_pin(pin)
+        self.signal_timers = {}  # camera_id: time the signal of the camera was raised
         self.rs845_alarm = AlarmHandler()  # legacy alarm
 
         self.gd_result_handler = GoogleDriveResultHandler()
@@ -221,6 +388,7 @@ class DetectorApp(UI.Ui_MainWindow, BufferPackedResult):
         self.pushButton_poweroff.clicked.connect(self.ask_poweroff)
 
         self.fpe.sig_source.connect(self.update_pp_to_ui)
+        self.fpe.sig_mode.connect(self.on_scheduled_mode)
         self.comboBox_mode.currentIndexChanged.connect(self.on_mode_change)
 
         self.horizontalScrollBar_offsetLeft.valueChanged.connect(self.on_left_offset_change)
@@ -253,22 +421,90 @@ class DetectorApp(UI.Ui_MainWindow, BufferPackedResult):
         if not self.pushButton_enableAlarm.isChecked():
             self.gpio.alarm_low()
             self.rs845_alarm.turn_off_alarm()
-            self.gpio.signal_low()
+            for pin in self.get_signal_pins():
+                self.gpio.signal_low(pin)
             self.enable_detection_timer = time.time()
-        else:
-            self.spot_frame_cnt = 0
-            self.spot_frame_timer = time.time()
+        for cam, tracker in self.spot_trackers.items():
+            for track in tracker.flush():
+                self.finish_spot_track(cam, track)
 
     def on_mode_change(self):
         if self.comboBox_mode.currentIndex() == 0:
             self.fpe.use_cv()
-            self.horizontalScrollBar_contrast.setEnabled(True)
-            self.update_contrast_label()
         elif self.comboBox_mode.currentIndex() == 1:
             self.fpe.use_yolo()
+        elif self.comboBox_mode.currentIndex() == 2:
+            self.fpe.use_cascade()
+        elif self.comboBox_mode.currentIndex() == 3:
+            self.fpe.use_fused()
+        self.update_mode_ui()
+        self.settings.set_setting_value('mode', self.comboBox_mode.currentIndex())
+        if self.fpe.scheduler is not None:
+            # the operator's choice: the scheduler goes on from there
+            self.fpe.reseed_quality(self.comboBox_mode.currentIndex())
+
+    def on_scheduled_mode(self, mode: int):
+        # show the mode the quality scheduler switched to, without switching again
+        self.comboBox_mode.blockSignals(True)
+        self.comboBox_mode.setCurrentIndex(mode)
+        self.comboBox_mode.blockSignals(False)
+        self.update_mode_ui()
+        self.settings.set_setting_value('mode', mode)
+
+    def update_mode_ui(self):
+        if self.comboBox_mode.currentIndex() == 1:
             self.horizontalScrollBar_contrast.setEnabled(False)
             self.label_contrast.setText("禁用 Disabled")
-        self.settings.set_setting_value('mode', self.comboBox_mode.currentIndex())
+        else:
+            # the contrast still matters for the CV detector in the cascade and fused modes
+            self.horizontalScrollBar_contrast.setEnabled(True)
+            self.update_contrast_label()
+
+    def get_spot_tracker(self, cam: int) -> SpotTracker:
+        if cam not in self.spot_trackers:
+            self.spot_trackers[cam] = SpotTracker(self.settings.get_or_set_setting_value('spotTrackMinHits', 3),
+                                                  self.settings.get_or_set_setting_value('spotTrackMaxMisses', 5),
+                                                  self.settings.get_or_set_setting_value('spotTrackGate', 40))
+        return self.spot_trackers[cam]
+
+    @staticmethod
+    def keep_spot_view(result: FrameResult):
+        # copies, the frames stay valid after the pipeline buffers are reused
+        raw = result.raw.copy() if result.raw.ndim == 3 else cv.cvtColor(result.raw, cv.COLOR_GRAY2BGR)
+        return raw, result.overlay.copy(), result.detections.copy()
+
+    def save_spot_image(self, cam: int, track: SpotTrack, img_path: str = None):
+        raw, overlay, detections = track.payload
+        h, w = raw.shape[:2]
+        if img_path is None:
+            img_dir = self.gd_result_handler.result_dir + f"/{get_date_today()}"
+            create_dir_if_not_exists(img_dir)
+            out_path = img_dir + f"/{platform.node()}_SpotImg" + get_current_time_filename() + f"_{int(time.time() * 10) % 3}"
+            if self.fpe.num_cameras > 1:
+                out_path += f"_cam{cam}"
+            img_path = out_path + f"_spot{track.track_id}.jpg"
+        label_path = os.path.splitext(img_path)[0] + ".txt"
+        cv.imwrite(img_path, np.concatenate((raw, overlay)))
+        with open(label_path, "w") as f:
+            for label in to_yolo_labels(detections, w, h):
+                f.write(f"{label}\n")
+            f.close()
+        if img_path not in self.spot_img_paths:
+            self.spot_img_paths.append(img_path)
+        Log.info(f"Image saved to: {img_path}")
+        return img_path
+
+    def finish_spot_track(self, cam: int, track: SpotTrack):
+        # the track may have seen a better view of the spot after its image was saved, replace the image then
+        img_path, saved_payload = self.spot_track_images.pop((cam, track.track_id), (None, None))
+        if track.payload is not None and track.payload is not saved_payload:
+            self.save_spot_image(cam, track, img_path)
+
+    def get_signal_pin(self, cam: int):
+        return self.camera_signal_pins.get(cam, SIGNAL_PIN)
+
+    def get_signal_pins(self):
+        return {SIGNAL_PIN} | set(self.camera_signal_pins.values())
 
     def update_pp_to_ui(self, img):
         # noinspection PyArgumentList
@@ -277,54 +513,65 @@ class DetectorApp(UI.Ui_MainWindow, BufferPackedResult):
 
     def process_result(self):
         ret, result = self.fpe.get()
-        img_dir = self.gd_result_handler.result_dir + f"/{get_date_today()}"
         if ret:
+            result.t_display = time.time()
+            cam = result.camera_id
             pad_size = 35
-            info_str = f"檢測(Detect) FPS: {round(result['detector_fps'])},".ljust(pad_size)
-            info_str += f'運算時間(Compute Time):{round((time.time() - result["creation_time"]) * 1000, 2)} ms,'.ljust(
+            info_str = f"鏡頭(Camera) {cam}, ".ljust(pad_size) if self.fpe.num_cameras > 1 else ''
+            info_str += f"檢測(Detect) FPS: {round(result.detector_fps)},".ljust(pad_size)
+            if len(result.detector_latency) > 0:
+                info_str += ("延遲(Latency) " + " / ".join(
+                    f"{name.upper()} {round(latency, 1)} ms" for name, latency in result.detector_latency.items())
+                             + ",").ljust(pad_size)
+            info_str += f'運算時間(Compute Time):{round((result.t_display - result.t_capture) * 1000, 2)} ms,'.ljust(
                 pad_size)
             info_str += f'畫面更新(Frame update) FPS：{round(1 / (time.time() - self.update_timer), 2)},'.ljust(pad_size)
-            info_str += f'異物數量(Number of defects)：{result["num_spots"]}.'.ljust(pad_size)
+            info_str += f'異物數量(Number of defects)：{result.num_spots}.'.ljust(pad_size)
+            if result.coverage is not None:
+                info_str += f' 檢測覆蓋率(Coverage)：{round(result.coverage * 100, 1)} %'
+            if self.fpe.scheduler is not None:
+                info_str += f' 運行模式(Operating point)：{self.fpe.scheduler.current().name}'
             self.statusbar.showMessage(info_str)
-            if result['num_spots'] > 0 and self.pushButton_enableAlarm.isChecked():
-                self.spot_frame_cnt += 1
-                if self.spot_frame_cnt > 2:  # TODO Filter accident detection. If there are 2(?) frames within 0.5 sec that num_spot > 1
-                    self.gpio.alarm_high()
-                    self.rs845_alarm.turn_on_alarm()
-                    self.alarm_timer = time.time()
-                    self.gpio.signal_high()
-                    spot_out = np.concatenate((result['raw'], result['processed']))
-                    create_dir_if_not_exists(img_dir)
-                    out_path = img_dir + f"/{platform.node()}_SpotImg" + get_current_time_filename() + f"_{int(time.time() * 10) % 3}"
-                    img_path = out_path + ".jpg"
-                    label_path = out_path + ".txt"
-                    cv.imwrite(img_path, spot_out)
-                    with open(label_path, "w") as f:
-                        for label in result["labels"]:
-                            f.write(f"0 {label}\n")
-                        f.close()
-                    if img_path not in self.spot_img_paths:
-                        self.spot_img_paths.append(img_path)
-                    Log.info(f"Image saved to: {img_path}")
-                    Log.warning(f"Number of spots detected: {result['num_spots']}")
-                    self.tabWidget_liveView.setCurrentIndex(1)
-                    self.update_img_viewer(len(self.spot_img_paths) - 1)
-                    self.spot_frame_cnt = 0
+            confirmed = []
+            if self.pushButton_enableAlarm.isChecked():
+                # a spot raises the alarm once it was seen in spotTrackMinHits frames, and only once per spot
+                tracker = self.get_spot_tracker(cam)
+                tracks = tracker.update(result.detections, result.t_capture, result.raw.shape[1], result.raw.shape[0])
+                if any(track.improved for track in tracks):
+                    # one copy of the frame, shared by the confirmed tracks that got their best view of the spot in it
+                    payload = self.keep_spot_view(result)
+                    for track in tracks:
+                        if track.improved:
+                            track.payload = payload
+                confirmed = tracker.newly_confirmed
+                for track in tracker.finished:
+                    self.finish_spot_track(cam, track)
+            if len(confirmed) > 0:
+                self.gpio.alarm_high()
+                self.rs845_alarm.turn_on_alarm()
+                self.alarm_timer = time.time()
+                self.signal_timers[cam] = self.alarm_timer
+                self.gpio.signal_high(self.get_signal_pin(cam))
+                for track in confirmed:
+                    self.spot_track_images[(cam, track.track_id)] = (self.save_spot_image(cam, track), track.payload)
+                Log.warning(f"Number of spots detected on camera {cam}: {result.num_spots}, "
+                            f"new spots: {[track.track_id for track in confirmed]}")
+                self.tabWidget_liveView.setCurrentIndex(1)
+                self.update_img_viewer(len(self.spot_img_paths) - 1)
             else:
-                if time.time() - self.spot_frame_timer > 0.5:  # TODO Filter accident detection. If there are 2 frames within 0.5(?) sec that num_spot > 1
-                    self.spot_frame_cnt = 0
-                    self.spot_frame_timer = time.time()
+                if self.signal_timers.get(cam, 0) > 0 and time.time() - self.signal_timers[cam] > 0.5:
+                    self.gpio.signal_low(self.get_signal_pin(cam))
+                    self.signal_timers[cam] = 0
                 if self.alarm_timer > 0 and time.time() - self.alarm_timer > 0.5:
-                    self.gpio.signal_low()
                     if time.time() - self.alarm_timer > 6:
                         self.gpio.alarm_low()
                         self.rs845_alarm.turn_off_alarm()
 
             # Collect training data
             self.raw_target = self.gd_data_handler.get_raw_target_today()
-            if self.pushButton_enableAlarm.isChecked() and result['num_spots'] == 0 and self.raw_target > 0:
+            if self.pushButton_enableAlarm.isChecked() and result.num_spots == 0 and self.raw_target > 0:
                 img_out = self.gd_data_handler.get_local_raw_img_dir_today() + f"/{platform.node()}_raw_{get_current_time_filename()}_{self.raw_target}.jpg"
-                cv.imwrite(img_out, result['raw'])
+                cv.imwrite(img_out, result.raw)
                 self.gd_data_handler.record_new_raw_timestamp()
                 Log.info(f"Raw image{self.raw_target} has been saved to{img_out}")
 
@@ -335,6 +582,7 @@ class DetectorApp(UI.Ui_MainWindow, BufferPackedResult):
                 self.pushButton_enableAlarm.setText(
                     f"啓動檢測(Start) {round(_ENABLE_DETECTION_TIME - time.time() + self.enable_detection_timer)} s")
                 self.alarm_timer = -1
+                self.signal_timers = {}
             else:
                 self.pushButton_enableAlarm.setText(f"檢測中(Working)")
             self.put(result)
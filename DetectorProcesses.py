@@ -0,0 +1,274 @@
+"""
+Multi-process detection pipeline: FramePreProcessor and the detectors run in worker processes, so capture,
+pre-processing, inference / NMS and the Qt UI no longer share one GIL.
+
+    pre-processor process --det_queue--> detector process --out_queue--> main process (ProcessPipeline.get())
+              ^                                                                   |
+              +--------------------------------- free_slots <--------------------+
+
+Frames stay in the slots of a SharedFrameRing; the queues only carry slot indexes and the FrameResult metadata.
+Setting changes and the CV / YOLO switch are forwarded to the workers through their control queues.
+"""
+import multiprocessing as mp
+import queue
+import time
+
+import numpy as np
+
+from Detector import DetectSettings, BufferPackedResult, FramePreProcessor, YoloV5Detector, CVSpotDetector, \
+    FusedDetector, FrameResult
+from libs.FrameRing import FramePool
+from libs.Log import Log
+from libs.SharedFrameRing import SharedFrameRing, shared_memory_available
+
+
+def send_to_ring(ring: SharedFrameRing, free_slots, out_queue, packed_result: FrameResult) -> bool:
+    try:
+        idx = free_slots.get_nowait()
+    except queue.Empty:
+        # every slot is still on its way downstream, drop this frame
+        return False
+    layout = ring.write(idx, [packed_result.raw, packed_result.processed])
+    if layout is None:
+        free_slots.put(idx)
+        Log.warning(f"Frame {packed_result.raw.shape} does not fit into a shared frame slot, "
+                    f"raise multiProcessMaxFrameSize.")
+        return False
+    packed_result.raw = None
+    packed_result.processed = None
+    out_queue.put((idx, layout, packed_result))
+    return True
+
+
+def handle_control_messages(control_queue, settings: DetectSettings, handlers: dict) -> bool:
+    """
+    return: False once the main process asked to stop
+    """
+    while True:
+        try:
+            msg = control_queue.get_nowait()
+        except queue.Empty:
+            return True
+        if msg[0] == 'stop':
+            return False
+        if msg[0] == 'setting':
+            settings.apply_setting_value(msg[1], msg[2])
+        elif msg[0] in handlers:
+            handlers[msg[0]](*msg[1:])
+
+
+def pre_processor_process(config_file: str, config_dict: dict, ring_name: str, num_slots: int, slot_bytes: int,
+                          free_slots, det_queue, control_queue):
+    settings = DetectSettings(config_file)
+    settings.config_dict.update(config_dict)
+    ring = SharedFrameRing(num_slots, slot_bytes, ring_name)
+    pre_processor = FramePreProcessor(settings)
+    pre_processor.start_grabbers()
+    handlers = {'pre_process': pre_processor.set_pre_process}
+    while handle_control_messages(control_queue, settings, handlers) and pre_processor.is_capturing():
+        pre_processor.main_body()
+        ret, packed_result = pre_processor.get()
+        while ret:
+            send_to_ring(ring, free_slots, det_queue, packed_result)
+            ret, packed_result = pre_processor.get()
+    det_queue.put(None)  # end of stream
+    pre_processor.on_end()
+    ring.close()
+
+
+class SharedRingReceiver(BufferPackedResult):
+    """
+    Stands in for the FramePreProcessor in the detector process: get() / wait_for_new() take the frames
+    coming from the pre-processor process. Only the newest waiting frame of each camera is kept, the slots of
+    older ones go straight back to the pre-processor. So do the slots of results dropped later on (this buffer or a
+    detector's output buffer overflowing, see discard()).
+    """
+
+    def __init__(self, ring: SharedFrameRing, in_queue, free_slots, num_cameras: int):
+        BufferPackedResult.__init__(self, 2 * num_cameras)
+        self.ring = ring
+        self.in_queue = in_queue
+        self.free_slots = free_slots
+        self.num_cameras = num_cameras
+        self.slots = {}  # id(packed_result): (slot index, layout)
+        self.finished = False
+        self.on_drop = self.discard
+
+    def receive(self, timeout: float = None) -> bool:
+        items = []
+        try:
+            items.append(self.in_queue.get(timeout=timeout) if timeout else self.in_queue.get_nowait())
+            while True:
+                items.append(self.in_queue.get_nowait())
+        except queue.Empty:
+            pass
+        newest = {}  # camera_id: (slot index, layout, packed_result)
+        for item in items:
+            if item is None:
+                self.finished = True
+                continue
+            cam = item[2].camera_id
+            if cam in newest:
+                self.free_slots.put(newest[cam][0])
+                self.num_dropped += 1
+            newest[cam] = item
+        for idx, layout, packed_result in newest.values():
+            packed_result.raw, packed_result.processed = self.ring.read(idx, layout)
+            self.slots[id(packed_result)] = (idx, layout)
+            self.put(packed_result)
+        return len(newest) > 0
+
+    def get(self):
+        if not self.has_new():
+            self.receive()
+        return BufferPackedResult.get(self)
+
+    def wait_for_new(self, timeout: float = None) -> bool:
+        return self.has_new() or self.receive(timeout)
+
+    def release(self, packed_result: FrameResult):
+        # drop the views into the ring and hand the slot on, the frames stay in it
+        packed_result.raw = None
+        packed_result.processed = None
+        packed_result.overlay = None
+        return self.slots.pop(id(packed_result))
+
+    def discard(self, packed_result: FrameResult):
+        idx, _ = self.release(packed_result)
+        self.free_slots.put(idx)
+
+
+def detector_process(config_file: str, config_dict: dict, ring_name: str, num_slots: int, slot_bytes: int,
+                     num_cameras: int, with_yolo: bool, free_slots, det_queue, out_queue, control_queue):
+    settings = DetectSettings(config_file)
+    settings.config_dict.update(config_dict)
+    ring = SharedFrameRing(num_slots, slot_bytes, ring_name)
+    receiver = SharedRingReceiver(ring, det_queue, free_slots, num_cameras)
+    detectors = {'cv': CVSpotDetector(receiver, settings)}
+    if with_yolo:
+        detectors['yolo'] = YoloV5Detector(receiver, settings)
+        detectors['fused'] = FusedDetector(receiver, settings, detectors['cv'], detectors['yolo'])
+    for detector in detectors.values():
+        detector.on_drop = receiver.discard
+    active = {'detector': detectors['cv']}
+
+    def forward_results(detector):
+        ret, packed_result = detector.get()
+        while ret:
+            idx, layout = receiver.release(packed_result)
+            out_queue.put((idx, layout, packed_result))
+            ret, packed_result = detector.get()
+
+    def set_mode(mode: str):
+        # the results of the old mode still on the GPU / in its output buffer hold ring slots
+        if 'yolo' in detectors:
+            detectors['yolo'].flush()
+        for detector in detectors.values():
+            forward_results(detector)
+        if 'yolo' in detectors:
+            detectors['yolo'].set_screener(detectors['cv'] if mode == 'cascade' else None)
+        active['detector'] = detectors.get('yolo' if mode == 'cascade' else mode, detectors['cv'])
+
+    handlers = {'mode': set_mode}
+    while handle_control_messages(control_queue, settings, handlers) and not receiver.finished:
+        detector = active['detector']
+        if detector.wait_for_input(detector.wait_timeout):
+            detector.main_body()
+        forward_results(detector)
+    out_queue.put(None)
+    for detector in detectors.values():
+        detector.on_end()
+    ring.close()
+
+
+class ProcessPipeline:
+    """
+    Main process side: starts the worker processes and returns their results with the frames copied out of the
+    shared ring, so the slots go back to the pre-processor right away.
+    """
+    _JOIN_TIMEOUT = 3
+
+    @staticmethod
+    def is_supported() -> bool:
+        return shared_memory_available()
+
+    def __init__(self, settings: DetectSettings, num_cameras: int, with_yolo=True):
+        # spawn: the workers must not inherit the CUDA context / Qt state of this process
+        ctx = mp.get_context('spawn')
+        self.settings = settings
+        self.num_cameras = num_cameras
+        num_slots = max(settings.get_or_set_setting_value('multiProcessSlots', 6), 2 * num_cameras + 2)
+        max_w, max_h = settings.get_or_set_setting_value('multiProcessMaxFrameSize', (1280, 720))
+        # raw BGR frame + processed frame
+        slot_bytes = 2 * (max_w * max_h * 3 + SharedFrameRing.ALIGN)
+        self.ring = SharedFrameRing(num_slots, slot_bytes)
+        self.free_slots = ctx.Queue()
+        for idx in range(num_slots):
+            self.free_slots.put(idx)
+        self.det_queue = ctx.Queue()
+        self.out_queue = ctx.Queue()
+        self.pre_control = ctx.Queue()
+        self.det_control = ctx.Queue()
+        config_dict = dict(settings.config_dict)
+        self.processes = [
+            ctx.Process(target=pre_processor_process, name='FramePreProcessor', daemon=True,
+                        args=(settings.config_file, config_dict, self.ring.name, num_slots, slot_bytes,
+                              self.free_slots, self.det_queue, self.pre_control)),
+            ctx.Process(target=detector_process, name='Detector', daemon=True,
+                        args=(settings.config_file, config_dict, self.ring.name, num_slots, slot_bytes,
+                              num_cameras, with_yolo, self.free_slots, self.det_queue, self.out_queue,
+                              self.det_control))]
+        self.frame_pool = FramePool(settings.get_or_set_setting_value('framePoolDepth', 12))
+        self.finished = False
+        settings.subscribe_to_any_change(self.forward_setting)
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        Log.info(f"Detection pipeline running in {len(self.processes)} worker processes, "
+                 f"{self.ring.num_slots} shared frame slots.")
+
+    def forward_setting(self, setting_name: str, value):
+        self.pre_control.put(('setting', setting_name, value))
+        self.det_control.put(('setting', setting_name, value))
+
+    def set_mode(self, mode: str):
+        # 'cv', 'yolo', 'cascade' or 'fused'
+        self.pre_control.put(('pre_process', mode != 'yolo'))
+        self.det_control.put(('mode', mode))
+
+    def get(self, timeout: float = None):
+        try:
+            item = self.out_queue.get(timeout=timeout)
+        except queue.Empty:
+            return False, None
+        if item is None:
+            self.finished = True
+            return False, None
+        idx, layout, packed_result = item
+        raw, processed = self.ring.read(idx, layout)
+        cam = packed_result.camera_id
+        packed_result.raw = self.frame_pool.get(f'raw{cam}', raw.shape, raw.dtype)
+        np.copyto(packed_result.raw, raw)
+        if processed is None:
+            packed_result.processed = packed_result.raw
+        else:
+            packed_result.processed = self.frame_pool.get(f'processed{cam}', processed.shape, processed.dtype)
+            np.copyto(packed_result.processed, processed)
+        del raw, processed
+        self.free_slots.put(idx)
+        return True, packed_result
+
+    def stop(self):
+        for control in (self.pre_control, self.det_control):
+            control.put(('stop',))
+        timer = time.time()
+        for process in self.processes:
+            if process.pid is None:
+                continue
+            process.join(max(0., self._JOIN_TIMEOUT - (time.time() - timer)))
+            if process.is_alive():
+                Log.warning(f"{process.name} process did not stop, terminating it.")
+                process.terminate()
+        self.ring.close()
+        Log.info("Detection worker processes terminated.")
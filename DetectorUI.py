@@ -722,6 +722,8 @@ class Ui_MainWindow(object):
         self.comboBox_mode.setObjectName("comboBox_mode")
         self.comboBox_mode.addItem("")
         self.comboBox_mode.addItem("")
+        self.comboBox_mode.addItem("")
+        self.comboBox_mode.addItem("")
         self.horizontalLayout_2.addWidget(self.comboBox_mode)
         self.widget1 = QtWidgets.QWidget(self.centralwidget)
         self.widget1.setGeometry(QtCore.QRect(20, 20, 361, 111))
@@ -1423,6 +1425,8 @@ class Ui_MainWindow(object):
         self.comboBox_mode.setCurrentText(_translate("MainWindow", " 機器視覺（CV）"))
         self.comboBox_mode.setItemText(0, _translate("MainWindow", " 機器視覺（CV）"))
         self.comboBox_mode.setItemText(1, _translate("MainWindow", "  AI-Yolo5 (Beta)"))
+        self.comboBox_mode.setItemText(2, _translate("MainWindow", "  CV + AI (Cascade)"))
+        self.comboBox_mode.setItemText(3, _translate("MainWindow", "  CV + AI (Fusion)"))
         self.pushButton_reboot.setText(_translate("MainWindow", "重啓(Reboot)"))
         self.pushButton_poweroff.setText(_translate("MainWindow", "關機(Power off)"))
         self.pushButton_exit.setText(_translate("MainWindow", "退出(Exit)"))
@@ -82,12 +82,16 @@ class GPIOHandler:
             t.start()
 
     @staticmethod
-    def signal_high():
-        GPIO.output(SIGNAL_PIN, GPIO.HIGH)
+    def setup_output_pin(pin):
+        GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
 
     @staticmethod
-    def signal_low():
-        GPIO.output(SIGNAL_PIN, GPIO.LOW)
+    def signal_high(pin=SIGNAL_PIN):
+        GPIO.output(pin, GPIO.HIGH)
+
+    @staticmethod
+    def signal_low(pin=SIGNAL_PIN):
+        GPIO.output(pin, GPIO.LOW)
 
     @staticmethod
     def alarm_high():
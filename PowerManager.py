@@ -210,7 +210,7 @@ class PowerManager(ThreadRunnable):
         self.power_disconnected = self.ups.getPower_W() > 6
         if self.power_disconnected:
             self.power_disconnect_call_back()
-        time.sleep(5)
+        self.sleep(5)
 
     def on_end(self):
         pass
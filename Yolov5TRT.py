@@ -1,6 +1,6 @@
 import os
-import random
 import time
+from collections import deque
 
 import cv2
 import numpy as np
@@ -9,6 +9,7 @@ import pycuda.autoinit
 import pycuda.driver as cuda
 import tensorrt as trt
 
+from libs.ImageProcessingFunctions import plot_one_box
 from libs.Log import Log
 
 
@@ -26,47 +27,47 @@ def get_img_path_batches(batch_size, img_dir):
     return ret
 
 
-def plot_one_box(x, img, color=None, label=None, line_thickness=None):
+class InferenceSlot(object):
     """
-    description: Plots one bounding box on image img,
-                 this function comes from YoLov5 project.
-    param:
-        x:      a box likes [x1,y1,x2,y2]
-        img:    an opencv image object
-        color:  color to draw rectangle, such as (0,255,0)
-        label:  str
-        line_thickness: int
-    return:
-        no return
-
+    description: One set of pinned host / device buffers with its own CUDA stream and execution context,
+                 so that a batch can be in flight while the next one is being preprocessed.
     """
-    tl = (
-            line_thickness or round(0.002 * (img.shape[0] + img.shape[1]) / 2) + 1
-    )  # line/font thickness
-    color = color or [random.randint(0, 255) for _ in range(3)]
-    c1, c2 = (int(x[0]), int(x[1])), (int(x[2]), int(x[3]))
-    cv2.rectangle(img, c1, c2, color, thickness=tl, lineType=cv2.LINE_AA)
-    if label:
-        tf = max(tl - 1, 1)  # font thickness
-        t_size = cv2.getTextSize(label, 0, fontScale=tl / 3, thickness=tf)[0]
-        c2 = c1[0] + t_size[0], c1[1] - t_size[1] - 3
-        cv2.rectangle(img, c1, c2, color, -1, cv2.LINE_AA)  # filled
-        cv2.putText(
-            img,
-            label,
-            (c1[0], c1[1] - 2),
-            0,
-            tl / 3,
-            [225, 255, 255],
-            thickness=tf,
-            lineType=cv2.LINE_AA,
-        )
+
+    def __init__(self, engine):
+        # noinspection PyArgumentList
+        self.stream = cuda.Stream()
+        self.context = engine.create_execution_context()
+        self.host_inputs = []
+        self.cuda_inputs = []
+        self.host_outputs = []
+        self.cuda_outputs = []
+        self.bindings = []
+        for binding in engine:
+            size = trt.volume(engine.get_binding_shape(binding)) * engine.max_batch_size
+            dtype = trt.nptype(engine.get_binding_dtype(binding))
+            host_mem = cuda.pagelocked_empty(size, dtype)
+            cuda_mem = cuda.mem_alloc(host_mem.nbytes)
+            self.bindings.append(int(cuda_mem))
+            if engine.binding_is_input(binding):
+                self.host_inputs.append(host_mem)
+                self.cuda_inputs.append(cuda_mem)
+            else:
+                self.host_outputs.append(host_mem)
+                self.cuda_outputs.append(cuda_mem)
+        self.start_event = cuda.Event()
+        self.end_event = cuda.Event()
+        self.busy = False
+        self.tag = None
+        self.batch_size = 0
+        self.batch_origin_h = []
+        self.batch_origin_w = []
 
 
 class Yolov5TRT(object):
     """
     description: A YOLOv5 class that warps TensorRT ops, preprocess and postprocess ops.
     """
+    NMS_METHODS = ('greedy', 'matrix', 'fast', 'cv')
 
     def __init__(self, engine_file_path, categories: list):
         # Create a Context on this device,
@@ -78,6 +79,7 @@ class Yolov5TRT(object):
         runtime = trt.Runtime(trt_logger)
         self.categories = categories
         self.conf_thresh = 0.5
+        self.nms_method = 'matrix'
 
         # Deserialize the engine from file
         with open(engine_file_path, "rb") as f:
@@ -105,6 +107,8 @@ class Yolov5TRT(object):
                 host_inputs.append(host_mem)
                 cuda_inputs.append(cuda_mem)
             else:
+                # per-image output stride: [num_boxes, cx, cy, w, h, conf, cls_id, ...]
+                self.output_size = trt.volume(engine.get_binding_shape(binding))
                 host_outputs.append(host_mem)
                 cuda_outputs.append(cuda_mem)
 
@@ -118,11 +122,288 @@ class Yolov5TRT(object):
         self.cuda_outputs = cuda_outputs
         self.bindings = bindings
         self.batch_size = engine.max_batch_size
+        # Letterbox geometry and resize buffer per input image size, see preprocess_into()
+        self._letterbox_cache = {}
+        # Pipelined execution, see init_async_slots()
+        self.async_slots = []
+        self.async_queue = deque()  # busy slots in submission order
+
+    def init_async_slots(self, depth=2):
+        """
+        description: Allocate `depth` InferenceSlots for submit() / poll(), so that H2D copy, execution and D2H copy
+                     of one batch overlap with preprocessing and NMS of its neighbours.
+        """
+        self.ctx.push()
+        self.async_slots = [InferenceSlot(self.engine) for _ in range(depth)]
+        self.ctx.pop()
+        Log.info(f"Yolov5 TRT pipelined execution with {depth} slots")
+
+    def can_submit(self):
+        return any(not slot.busy for slot in self.async_slots)
+
+    def num_pending(self):
+        return len(self.async_queue)
+
+    def submit(self, raw_images: list, tag=None):
+        """
+        description: Preprocess up to max_batch_size images into a free slot and enqueue the transfers and the
+                     execution on the slot's stream without waiting for the GPU.
+        param:
+            raw_images: list of BGR images
+            tag: anything, handed back by poll() with the results
+        return:
+            False if all slots are busy, poll() first
+        """
+        free_slots = [slot for slot in self.async_slots if not slot.busy]
+        if len(free_slots) == 0:
+            return False
+        slot = free_slots[0]
+        raw_images = raw_images[:self.batch_size]
+        batch_size = len(raw_images)
+        input_size = 3 * self.input_h * self.input_w
+        self.ctx.push()
+        slot.batch_origin_h = []
+        slot.batch_origin_w = []
+        for i, raw_image in enumerate(raw_images):
+            origin_h, origin_w = self.preprocess_into(raw_image, slot.host_inputs[0], i)
+            slot.batch_origin_h.append(origin_h)
+            slot.batch_origin_w.append(origin_w)
+        slot.start_event.record(slot.stream)
+        cuda.memcpy_htod_async(slot.cuda_inputs[0], slot.host_inputs[0][:batch_size * input_size], slot.stream)
+        slot.context.execute_async(
+            batch_size=batch_size, bindings=slot.bindings, stream_handle=slot.stream.handle
+        )
+        cuda.memcpy_dtoh_async(slot.host_outputs[0][:batch_size * self.output_size], slot.cuda_outputs[0], slot.stream)
+        slot.end_event.record(slot.stream)
+        self.ctx.pop()
+        slot.busy = True
+        slot.tag = tag
+        slot.batch_size = batch_size
+        self.async_queue.append(slot)
+        return True
+
+    def poll(self, block=False):
+        """
+        description: Collect the oldest submitted batch if the GPU is done with it.
+        param:
+            block: wait for the GPU instead of returning right away
+        return:
+            ret: False if nothing is finished
+            tag: the tag given to submit()
+            batch_results: list of (result_boxes, result_scores, result_classid), one per image
+            inference_time: GPU time of the batch
+        """
+        if len(self.async_queue) == 0:
+            return False, None, [], 0
+        slot = self.async_queue[0]
+        self.ctx.push()
+        if block:
+            slot.end_event.synchronize()
+        elif not slot.end_event.query():
+            self.ctx.pop()
+            return False, None, [], 0
+        inference_time = slot.end_event.time_since(slot.start_event) / 1000
+        self.ctx.pop()
+        self.async_queue.popleft()
+        output = slot.host_outputs[0]
+        batch_results = []
+        for i in range(slot.batch_size):
+            batch_results.append(self.post_process(
+                output[i * self.output_size: (i + 1) * self.output_size], slot.batch_origin_h[i], slot.batch_origin_w[i]
+            ))
+        tag = slot.tag
+        slot.tag = None
+        slot.busy = False
+        return True, tag, batch_results, inference_time
 
     def set_conf_thresh(self, v):
         self.conf_thresh = v
 
+    def set_nms_method(self, v):
+        """
+        description: NMS engine used by non_max_suppression()
+        param:
+            v:  'greedy' - reference python loop
+                'matrix' - same result as 'greedy', from one pairwise IoU matrix
+                'fast'   - fully vectorized upper-triangular suppression, may drop a few more boxes than greedy
+                'cv'     - cv2.dnn.NMSBoxes
+        """
+        if v not in self.NMS_METHODS:
+            Log.warning(f"Unknown NMS method {v}, keep using {self.nms_method}")
+            return
+        self.nms_method = v
+
     def inference(self, raw_image):
+        batch_results, inference_time = self.inference_batch([raw_image])
+        result_boxes, result_scores, result_classid = batch_results[0]
+        # Draw rectangles and labels on the original image
+        self.draw_results(raw_image, result_boxes, result_scores, result_classid)
+        return raw_image, inference_time, len(result_boxes), result_boxes
+
+    def inference_batch(self, raw_images: list):
+        """
+        description: Run several images (e.g. one per camera or consecutive frames) through the engine,
+                     max_batch_size images per execution.
+        param:
+            raw_images: list of BGR images
+        return:
+            batch_results: list of (result_boxes, result_scores, result_classid), one per image
+            inference_time: GPU time of all executions
+        """
+        batch_results = []
+        inference_time = 0
+        for i in range(0, len(raw_images), self.batch_size):
+            results, t = self._inference_chunk(raw_images[i:i + self.batch_size])
+            batch_results += results
+            inference_time += t
+        return batch_results, inference_time
+
+    def tile_grid(self, h, w, tile_w=None, tile_h=None, overlap=32):
+        """
+        description: Overlapping tiles covering an h x w image, tiles are spread evenly so that the overlap of
+                     neighbours is at least `overlap` pixels.
+        param:
+            tile_w, tile_h: tile size, default: the engine input size (native resolution, no down scaling)
+        return:
+            tiles: list of (x1, y1, x2, y2)
+        """
+        tile_w = min(tile_w or self.input_w, w)
+        tile_h = min(tile_h or self.input_h, h)
+
+        def starts(size, tile):
+            if size <= tile:
+                return [0]
+            num = int(np.ceil((size - overlap) / max(1, tile - overlap)))
+            return [int(round(x)) for x in np.linspace(0, size - tile, max(2, num))]
+
+        return [(x, y, x + tile_w, y + tile_h) for y in starts(h, tile_h) for x in starts(w, tile_w)]
+
+    def candidate_windows(self, h, w, points, win_w=None, win_h=None, margin=16):
+        """
+        description: Windows around candidate points (e.g. CV blobs), one window for every group of candidates that
+                     fit into one, so that a cluster of candidates costs a single crop.
+        param:
+            points: nx2 candidate centers (x, y)
+            win_w, win_h: window size, default: the engine input size (native resolution, no down scaling)
+            margin: minimum distance of a candidate from the window border, room for the object around the center
+        return:
+            windows: list of (x1, y1, x2, y2)
+        """
+        win_w = min(win_w or self.input_w, w)
+        win_h = min(win_h or self.input_h, h)
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        covered = np.zeros(len(points), dtype=bool)
+        windows = []
+        for i in np.lexsort((points[:, 0], points[:, 1])):
+            if covered[i]:
+                continue
+            # the first uncovered candidate (top to bottom) near the top left of the window, so that the window
+            # takes in as many of the following candidates as possible
+            x1 = int(np.clip(points[i, 0] - win_w / 2, 0, w - win_w))
+            y1 = int(np.clip(points[i, 1] - margin, 0, h - win_h))
+            x2, y2 = x1 + win_w, y1 + win_h
+            # no margin needed along the image border
+            covered |= (points[:, 0] >= x1 + (margin if x1 > 0 else 0)) & \
+                       (points[:, 0] <= x2 - (margin if x2 < w else 0)) & \
+                       (points[:, 1] >= y1 + (margin if y1 > 0 else 0)) & \
+                       (points[:, 1] <= y2 - (margin if y2 < h else 0))
+            covered[i] = True
+            windows.append((x1, y1, x2, y2))
+        return windows
+
+    def inference_tiled(self, raw_images: list, tile_size=None, overlap=32, merge_thres=0.5):
+        """
+        description: Tiled inference for small objects: every image is cut into overlapping tiles which all go
+                     through the engine as batches, boxes are moved back to image coordinates and the duplicates
+                     along the tile seams are merged.
+        param:
+            raw_images: list of BGR images
+            tile_size: (w, h) of a tile, default: the engine input size
+            overlap: minimum overlap of neighbouring tiles in pixels, should exceed the largest object
+            merge_thres: boxes overlapping more than this (intersection over the smaller box) are merged
+        return:
+            batch_results: list of (result_boxes, result_scores, result_classid), one per image
+            inference_time: GPU time of all executions
+        """
+        tile_w, tile_h = tile_size or (None, None)
+        image_tiles = [self.tile_grid(raw_image.shape[0], raw_image.shape[1], tile_w, tile_h, overlap)
+                       for raw_image in raw_images]
+        return self.inference_windows(raw_images, image_tiles, merge_thres)
+
+    def inference_windows(self, raw_images: list, image_windows: list, merge_thres=0.5):
+        """
+        description: Inference on windows of the images (tiles, windows around candidates...), the crops of all
+                     images go through the engine as batches, boxes are moved back to image coordinates and the
+                     duplicates of overlapping windows are merged.
+        param:
+            raw_images: list of BGR images
+            image_windows: list of [(x1, y1, x2, y2), ...], one list per image, may be empty
+            merge_thres: boxes overlapping more than this (intersection over the smaller box) are merged
+        return:
+            batch_results: list of (result_boxes, result_scores, result_classid), one per image
+            inference_time: GPU time of all executions
+        """
+        crops = [raw_image[y1:y2, x1:x2] for raw_image, windows in zip(raw_images, image_windows)
+                 for x1, y1, x2, y2 in windows]
+        window_results, inference_time = self.inference_batch(crops) if len(crops) > 0 else ([], 0)
+        batch_results = []
+        i = 0
+        for windows in image_windows:
+            rows = []
+            for x1, y1, _, _ in windows:
+                result_boxes, result_scores, result_classid = window_results[i]
+                i += 1
+                if len(result_boxes) == 0:
+                    continue
+                window_rows = np.empty((len(result_boxes), 6), dtype=np.float32)
+                window_rows[:, :4] = result_boxes + np.array([x1, y1, x1, y1], dtype=np.float32)
+                window_rows[:, 4] = result_scores
+                window_rows[:, 5] = result_classid
+                rows.append(window_rows)
+            if len(rows) == 0:
+                batch_results.append((np.array([]), np.array([]), np.array([])))
+                continue
+            boxes = self.merge_tile_boxes(np.concatenate(rows), merge_thres)
+            batch_results.append((boxes[:, :4], boxes[:, 4], boxes[:, 5]))
+        return batch_results, inference_time
+
+    @staticmethod
+    def merge_tile_boxes(boxes, merge_thres=0.5):
+        """
+        description: Merge detections of the same object from neighbouring tiles. An object cut by a seam shows up
+                     as a full box in one tile and a partial box in the other, so boxes are compared by intersection
+                     over the smaller box, and a kept box grows to the union of the boxes merged into it.
+        param:
+            boxes: (x1, y1, x2, y2, conf, cls_id)
+            merge_thres: intersection over the smaller box above which two boxes of a class are merged
+        return:
+            boxes: merged boxes, descending confidence
+        """
+        boxes = boxes[np.argsort(-boxes[:, 4])]
+        area = (boxes[:, 2] - boxes[:, 0] + 1) * (boxes[:, 3] - boxes[:, 1] + 1)
+        keep = np.ones(len(boxes), dtype=bool)
+        for i in range(len(boxes)):
+            if not keep[i]:
+                continue
+            # repeat while the box grows, an object may span more than two tiles
+            while True:
+                rest = np.nonzero(keep[i + 1:] & (boxes[i + 1:, 5] == boxes[i, 5]))[0] + i + 1
+                if len(rest) == 0:
+                    break
+                inter_w = np.clip(np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]) + 1,
+                                  0, None)
+                inter_h = np.clip(np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]) + 1,
+                                  0, None)
+                merged = rest[inter_w * inter_h / np.minimum(area[i], area[rest]) > merge_thres]
+                if len(merged) == 0:
+                    break
+                keep[merged] = False
+                boxes[i, :2] = np.minimum(boxes[i, :2], boxes[merged, :2].min(axis=0))
+                boxes[i, 2:4] = np.maximum(boxes[i, 2:4], boxes[merged, 2:4].max(axis=0))
+                area[i] = (boxes[i, 2] - boxes[i, 0] + 1) * (boxes[i, 3] - boxes[i, 1] + 1)
+        return boxes[keep]
+
+    def _inference_chunk(self, raw_images: list):
         # Make self the active context, pushing it on top of the context stack.
         self.ctx.push()
         # Restore
@@ -133,57 +414,50 @@ class Yolov5TRT(object):
         host_outputs = self.host_outputs
         cuda_outputs = self.cuda_outputs
         bindings = self.bindings
-        # Do image preprocess
-        batch_image_raw = []
+        batch_size = len(raw_images)
+        input_size = 3 * self.input_h * self.input_w
+        # Do image preprocess, straight into the batch slots of the host buffer
         batch_origin_h = []
         batch_origin_w = []
-        batch_input_image = np.empty(shape=[self.batch_size, 3, self.input_h, self.input_w])
-        input_image, image_raw, origin_h, origin_w = self.preprocess_image(raw_image)
-        batch_image_raw.append(raw_image)
-        batch_origin_h.append(origin_h)
-        batch_origin_w.append(origin_w)
-        np.copyto(batch_input_image[0], input_image)
-        batch_input_image = np.ascontiguousarray(batch_input_image)
-
-        # Copy input image to host buffer
-        np.copyto(host_inputs[0], batch_input_image.ravel())
+        for i, raw_image in enumerate(raw_images):
+            origin_h, origin_w = self.preprocess_into(raw_image, host_inputs[0], i)
+            batch_origin_h.append(origin_h)
+            batch_origin_w.append(origin_w)
         start = time.time()
-        # Transfer input data  to the GPU.
-        cuda.memcpy_htod_async(cuda_inputs[0], host_inputs[0], stream)
+        # Transfer input data to the GPU, only the used batch slots.
+        cuda.memcpy_htod_async(cuda_inputs[0], host_inputs[0][:batch_size * input_size], stream)
         # Run inference.
         context.execute_async(
-            batch_size=self.batch_size, bindings=bindings, stream_handle=stream.handle
+            batch_size=batch_size, bindings=bindings, stream_handle=stream.handle
         )
         # Transfer predictions back from the GPU.
-        cuda.memcpy_dtoh_async(host_outputs[0], cuda_outputs[0], stream)
+        cuda.memcpy_dtoh_async(host_outputs[0][:batch_size * self.output_size], cuda_outputs[0], stream)
         # Synchronize the stream
         # noinspection PyArgumentList
         stream.synchronize()
         end = time.time()
         # Remove any context from the top of the context stack, deactivating it.
         self.ctx.pop()
-        # Here we use the first row of output in that batch_size = 1
         output = host_outputs[0]
         # Do postprocess
-        result_boxes = []
-        for i in range(self.batch_size):
-            result_boxes, result_scores, result_classid = self.post_process(
-                output[i * 6001: (i + 1) * 6001], batch_origin_h[i], batch_origin_w[i]
+        results = []
+        for i in range(batch_size):
+            results.append(self.post_process(
+                output[i * self.output_size: (i + 1) * self.output_size], batch_origin_h[i], batch_origin_w[i]
+            ))
+        return results, end - start
+
+    def draw_results(self, image, result_boxes, result_scores, result_classid):
+        for j in range(len(result_boxes)):
+            plot_one_box(
+                result_boxes[j],
+                image,
+                label="{}:{:.2f}".format(
+                    self.categories[int(result_classid[j])], result_scores[j]
+                ),
+                line_thickness=1,
+                color=(0, 0, 255)
             )
-            # Draw rectangles and labels on the original image
-            for j in range(len(result_boxes)):
-                box = result_boxes[j]
-                plot_one_box(
-                    box,
-                    batch_image_raw[i],
-                    label="{}:{:.2f}".format(
-                        self.categories[int(result_classid[j])], result_scores[j]
-                    ),
-                    line_thickness=1,
-                    color=(0, 0, 255)
-                )
-            # batch_size = 1, so only return the first
-        return batch_image_raw[0], end - start, len(result_boxes), result_boxes
 
     def destroy(self):
         try:
@@ -195,6 +469,65 @@ class Yolov5TRT(object):
         finally:
             Log.info("Yolov5 TRT Backend Destroyed")
 
+    def letterbox_geometry(self, h, w):
+        """
+        description: Resize target and paddings for an h x w image, computed once per input size.
+        return:
+            tw, th: resized width and height
+            tx1, ty1: left and top padding
+            resize_buffer: preallocated th x tw x 3 uint8 output of cv2.resize
+        """
+        geometry = self._letterbox_cache.get((h, w))
+        if geometry is None:
+            r_w = self.input_w / w
+            r_h = self.input_h / h
+            if r_h > r_w:
+                tw = self.input_w
+                th = int(r_w * h)
+                tx1 = 0
+                ty1 = int((self.input_h - th) / 2)
+            else:
+                tw = int(r_h * w)
+                th = self.input_h
+                tx1 = int((self.input_w - tw) / 2)
+                ty1 = 0
+            geometry = (tw, th, tx1, ty1, np.empty((th, tw, 3), np.uint8))
+            self._letterbox_cache[(h, w)] = geometry
+        return geometry
+
+    def preprocess_into(self, raw_bgr_image, host_input, batch_idx):
+        """
+        description: Same result as preprocess_image(), but written straight into batch slot `batch_idx` of the
+                     pinned input buffer: resize into a cached buffer, then BGR->RGB, HWC->CHW and the [0,1]
+                     normalization in one float32 pass per channel. No intermediate full-size arrays.
+        param:
+            raw_bgr_image: BGR image
+            host_input: flat pinned float32 input buffer
+            batch_idx: index of the image in the batch
+        return:
+            h: original height
+            w: original width
+        """
+        h, w = raw_bgr_image.shape[:2]
+        tw, th, tx1, ty1, resize_buffer = self.letterbox_geometry(h, w)
+        if (tw, th) == (w, h):
+            resized = raw_bgr_image
+        else:
+            resized = cv2.resize(raw_bgr_image, (tw, th), dst=resize_buffer)
+        input_size = 3 * self.input_h * self.input_w
+        chw = host_input[batch_idx * input_size: (batch_idx + 1) * input_size].reshape(3, self.input_h, self.input_w)
+        # Pad the short side. preprocess_image() effectively pads with 0 (its (128,128,128) is taken as the dst
+        # argument of copyMakeBorder), keep it that way so that detections do not change
+        pad = 0.
+        chw[:, :ty1, :] = pad
+        chw[:, ty1 + th:, :] = pad
+        chw[:, ty1:ty1 + th, :tx1] = pad
+        chw[:, ty1:ty1 + th, tx1 + tw:] = pad
+        for c in range(3):
+            np.multiply(resized[:, :, 2 - c], np.float32(1 / 255.0), out=chw[c, ty1:ty1 + th, tx1:tx1 + tw],
+                        dtype=np.float32)
+        return h, w
+
     def preprocess_image(self, raw_bgr_image):
         """
         description: Convert BGR image to RGB,
@@ -333,6 +666,56 @@ class Yolov5TRT(object):
 
         return iou
 
+    @staticmethod
+    def pairwise_iou(boxes):
+        """
+        description: compute the IoU of every pair of boxes, same pixel convention as bbox_iou()
+        param:
+            boxes: A boxes numpy, each row is a box [x1, y1, x2, y2]
+        return:
+            iou: n x n IoU matrix
+        """
+        x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        area = (x2 - x1 + 1) * (y2 - y1 + 1)
+        inter_w = np.clip(np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]) + 1, 0, None)
+        inter_h = np.clip(np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]) + 1, 0, None)
+        inter_area = inter_w * inter_h
+        return inter_area / (area[:, None] + area[None, :] - inter_area + 1e-16)
+
+    def nms_keep(self, boxes, nms_thres):
+        """
+        description: Vectorized NMS over boxes sorted by descending confidence.
+                     Boxes are shifted by class_id * (max coordinate + 1) so that boxes of different classes never
+                     overlap, one pass handles all classes.
+        param:
+            boxes: sorted detections, (x1, y1, x2, y2, conf, cls_id)
+            nms_thres: an iou threshold to filter detections
+        return:
+            keep: boolean mask of the boxes to keep
+        """
+        num = boxes.shape[0]
+        if num == 0:
+            return np.zeros(0, dtype=bool)
+        coords = boxes[:, :4] + boxes[:, 5:6] * (boxes[:, :4].max() + 1)
+        if self.nms_method == 'cv':
+            xywh = coords.copy()
+            xywh[:, 2:] -= xywh[:, :2]
+            indices = cv2.dnn.NMSBoxes(xywh.tolist(), boxes[:, 4].tolist(), 0., nms_thres)
+            keep = np.zeros(num, dtype=bool)
+            keep[np.array(indices, dtype=int).reshape(-1)] = True
+            return keep
+        # overlap[j, i]: box i overlaps box j
+        overlap = self.pairwise_iou(coords) > nms_thres
+        if self.nms_method == 'fast':
+            # suppress a box if any box with a higher confidence overlaps it
+            return ~np.triu(overlap, k=1).any(axis=0)
+        # greedy: only boxes that are kept suppress the following ones
+        keep = np.ones(num, dtype=bool)
+        for i in range(num):
+            if keep[i]:
+                keep[i + 1:] &= ~overlap[i, i + 1:]
+        return keep
+
     def non_max_suppression(self, prediction, origin_h, origin_w, conf_thres, nms_thres=0.4):
         """
         description: Removes detections with lower object confidence score than 'conf_thres' and performs
@@ -359,6 +742,8 @@ class Yolov5TRT(object):
         confs = boxes[:, 4]
         # Sort by the confs
         boxes = boxes[np.argsort(-confs)]
+        if self.nms_method != 'greedy':
+            return boxes[self.nms_keep(boxes, nms_thres)]
         # Perform non-maximum suppression
         keep_boxes = []
         while boxes.shape[0]:
@@ -0,0 +1,144 @@
+import cv2 as cv
+import numpy as np
+
+from libs.Detections import detections_from_components, empty_detections
+
+'''
+Component spot detector: one threshold + cv.connectedComponentsWithStats() instead of cv.SimpleBlobDetector.
+
+SimpleBlobDetector binarizes the frame at every level from minThreshold to maxThreshold (thresholdStep apart),
+traces the contours of every level, computes the moments of every contour and groups the centers of all levels.
+One binarization, one labeling pass and filters over the stats array find the same spots, given the rules the blob
+detector applies on the way:
+    - a blob has to appear at minRepeatability levels, so the threshold lies that many steps inside the range
+      (match_blob_params())
+    - minArea/maxArea bound the area of a contour, not the pixel count: a bright spot is traced through the
+      centers of its outline pixels, half a pixel inside, a dark one (a hole in the binary image) through the
+      pixels around it, half a pixel outside; the circle of the equivalent diameter estimates that area
+    - the shape filters at 0..1 exclude a ratio of 1, so exactly convex, round contours are dropped; a blob of
+      up to 3x3 px always has one, a larger fleck hardly ever: MIN_SIZE
+    - a dark spot touching the border of the frame is no hole in the binary image, so it has no contour
+
+Flecks cover a tiny part of a frame, and labeling every pixel of it costs more than the threshold. The binary image
+is first reduced to 8x8 pixel cells (OR of the pixels: the padded binary image viewed as uint64 holds 8 pixels of a
+row per word, 8 words of a column are OR-ed), the cells are labeled, and only the bounding box of every cell region
+is labeled at full resolution. A component is 8-connected, so all its cells belong to one region, and each region
+is labeled with the other regions masked out. A frame with more than max_regions regions (noise, a too low
+threshold) is labeled in one pass.
+
+    polarity:   'dark' spots darker than the threshold (flecks on a bright fabric)
+                'bright' spots brighter than the threshold (residual of the pattern background model)
+    mode:       'fixed' the given threshold
+                'otsu' threshold picked from the histogram of each frame
+                'adaptive' local mean of a block_size neighbourhood minus adaptive_c (uneven lighting)
+
+Results are detection records (see Detections.py) like those of the blob keypoints: centroid and a square box of
+the equivalent diameter.
+'''
+
+
+class ComponentSpotDetector:
+    CELL = 8  # px, pixels per uint64 word
+    MIN_SIZE = 4  # px, smallest width and height of a spot
+
+    def __init__(self, threshold=127, min_area=0, max_area=10000, polarity='dark', mode='fixed', block_size=51,
+                 adaptive_c=10, connectivity=8, max_regions=64):
+        self.threshold = threshold
+        self.min_area = min_area
+        self.max_area = max_area
+        self.polarity = polarity
+        self.mode = mode
+        self.block_size = block_size | 1  # odd
+        self.adaptive_c = adaptive_c
+        self.connectivity = connectivity
+        self.max_regions = max_regions
+        self._padded = None
+        self._binary = None
+        self._labels = None
+        self._words = None
+
+    def match_blob_params(self, params, polarity: str):
+        """
+        threshold and area bounds finding the spots a cv.SimpleBlobDetector with these params finds
+        param: params: cv.SimpleBlobDetector_Params
+        """
+        # the blob detector binarizes at minThreshold, minThreshold + thresholdStep, ... below maxThreshold: a
+        # bright spot has to lie above the level minRepeatability - 1 steps up from the lowest, a dark one below
+        # the level as many steps down from the highest
+        margin = params.thresholdStep * (params.minRepeatability - 1)
+        top = params.minThreshold + params.thresholdStep * \
+            (np.ceil((params.maxThreshold - params.minThreshold) / params.thresholdStep) - 1)
+        self.polarity = polarity
+        self.threshold = params.minThreshold + margin if polarity == 'bright' else top - margin
+        self.min_area = params.minArea
+        self.max_area = params.maxArea
+
+    def binarize(self, image: np.ndarray) -> np.ndarray:
+        h, w = image.shape[:2]
+        if self._binary is None or self._binary.shape != (h, w):
+            # padded to whole cells with 0
+            cell = self.CELL
+            self._padded = np.zeros((-(-h // cell) * cell, -(-w // cell) * cell), dtype=np.uint8)
+            self._binary = self._padded[:h, :w]
+            self._labels = np.empty((h, w), dtype=np.int32)
+            self._words = self._padded.view(np.uint64).reshape(self._padded.shape[0] // cell, cell, -1)
+        binary_type = cv.THRESH_BINARY_INV if self.polarity == 'dark' else cv.THRESH_BINARY
+        if self.mode == 'adaptive':
+            # dark: below local mean - c, bright: above local mean + c
+            c = self.adaptive_c if self.polarity == 'dark' else -self.adaptive_c
+            cv.adaptiveThreshold(image, 255, cv.ADAPTIVE_THRESH_MEAN_C, binary_type, self.block_size, c,
+                                 dst=self._binary)
+            return self._binary
+        if self.mode == 'otsu':
+            binary_type |= cv.THRESH_OTSU
+        cv.threshold(image, self.threshold, 255, binary_type, dst=self._binary)
+        return self._binary
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        """
+        param: image: gray uint8 frame
+        return: DETECTION_DTYPE records of the spots
+        """
+        binary = self.binarize(image)
+        cell = self.CELL
+        cells = (np.bitwise_or.reduce(self._words, axis=1) != 0).view(np.uint8)
+        num, cell_labels, cell_stats, _ = cv.connectedComponentsWithStats(cells, connectivity=8, ltype=cv.CV_32S)
+        if num <= 1:
+            return empty_detections()
+        if num - 1 > self.max_regions:
+            stats, centroids = self.label(binary)
+        else:
+            all_stats, all_centroids = [], []
+            for region in range(1, num):
+                cx, cy, cw, ch = cell_stats[region, :4]
+                x, y = cx * cell, cy * cell
+                roi = binary[y:y + ch * cell, x:x + cw * cell]
+                # the part of the box belonging to this region (cells of other regions may overlap the box)
+                mask = cv.resize((cell_labels[cy:cy + ch, cx:cx + cw] == region).view(np.uint8),
+                                 (cw * cell, ch * cell), interpolation=cv.INTER_NEAREST)[:roi.shape[0], :roi.shape[1]]
+                stats, centroids = self.label(cv.bitwise_and(roi, roi, mask=mask))
+                stats[:, cv.CC_STAT_LEFT] += x
+                stats[:, cv.CC_STAT_TOP] += y
+                centroids += (x, y)
+                all_stats.append(stats)
+                all_centroids.append(centroids)
+            stats, centroids = np.concatenate(all_stats), np.concatenate(all_centroids)
+        x, y, w, h = (stats[:, i] for i in (cv.CC_STAT_LEFT, cv.CC_STAT_TOP, cv.CC_STAT_WIDTH, cv.CC_STAT_HEIGHT))
+        radius = np.sqrt(stats[:, cv.CC_STAT_AREA] / np.pi) + (0.5 if self.polarity == 'dark' else -0.5)
+        contour_area = np.pi * radius * radius
+        keep = (contour_area >= self.min_area) & (contour_area <= self.max_area) & \
+               (w >= self.MIN_SIZE) & (h >= self.MIN_SIZE)
+        if self.polarity == 'dark':
+            height, width = binary.shape
+            keep &= (x > 0) & (y > 0) & (x + w < width) & (y + h < height)
+        keep = np.flatnonzero(keep)
+        return detections_from_components(stats[keep], centroids[keep])
+
+    def label(self, binary: np.ndarray):
+        """
+        return: stats and centroids of the components, without the background (label 0)
+        """
+        labels = self._labels[:binary.shape[0], :binary.shape[1]]
+        _, _, stats, centroids = cv.connectedComponentsWithStatsWithAlgorithm(binary, self.connectivity, cv.CV_32S,
+                                                                              cv.CCL_GRANA, labels=labels)
+        return stats[1:], centroids[1:]
@@ -0,0 +1,160 @@
+import cv2 as cv
+import numpy as np
+
+'''
+Detection records: every detector reports its spots as one NumPy structured array (one record per spot),
+so downstream consumers (renderer, alarm, label writer, tracker...) handle CV and YOLO results the same way.
+
+    x, y:       box center, pixels of the (cropped) frame
+    w, h:       box size, pixels
+    score:      confidence, 1 for detectors without one
+    class_id:   category index
+    source:     detector that produced the record, SOURCE_*
+
+Text (YOLO label format) is only produced when a result is saved, see to_yolo_labels().
+'''
+
+DETECTION_DTYPE = np.dtype([('x', np.float32), ('y', np.float32), ('w', np.float32), ('h', np.float32),
+                            ('score', np.float32), ('class_id', np.int16), ('source', np.uint8)])
+
+SOURCE_CV = 0
+SOURCE_YOLO = 1
+
+
+def empty_detections(num=0) -> np.ndarray:
+    return np.zeros(num, dtype=DETECTION_DTYPE)
+
+
+def detections_from_keypoints(keypoints, source=SOURCE_CV) -> np.ndarray:
+    """
+    cv.KeyPoint blobs: a square box of the blob diameter around the blob center.
+    """
+    detections = empty_detections(len(keypoints))
+    if len(keypoints) == 0:
+        return detections
+    pts = np.array([(kp.pt[0], kp.pt[1], kp.size) for kp in keypoints], dtype=np.float32)
+    detections['x'] = pts[:, 0]
+    detections['y'] = pts[:, 1]
+    detections['w'] = pts[:, 2]
+    detections['h'] = pts[:, 2]
+    detections['score'] = 1
+    detections['source'] = source
+    return detections
+
+
+def detections_from_components(stats, centroids, source=SOURCE_CV) -> np.ndarray:
+    """
+    cv.connectedComponentsWithStats() rows: like a blob keypoint, a square box of the equivalent diameter around
+    the centroid.
+    """
+    detections = empty_detections(len(stats))
+    if len(stats) == 0:
+        return detections
+    detections['x'] = centroids[:, 0]
+    detections['y'] = centroids[:, 1]
+    diameter = 2 * np.sqrt(stats[:, cv.CC_STAT_AREA] / np.pi)
+    detections['w'] = diameter
+    detections['h'] = diameter
+    detections['score'] = 1
+    detections['source'] = source
+    return detections
+
+
+def detections_from_boxes(boxes, scores=None, class_ids=None, source=SOURCE_YOLO) -> np.ndarray:
+    """
+    boxes: nx4 [x1, y1, x2, y2]
+    """
+    detections = empty_detections(len(boxes))
+    if len(boxes) == 0:
+        return detections
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    detections['x'] = (boxes[:, 0] + boxes[:, 2]) / 2
+    detections['y'] = (boxes[:, 1] + boxes[:, 3]) / 2
+    detections['w'] = boxes[:, 2] - boxes[:, 0]
+    detections['h'] = boxes[:, 3] - boxes[:, 1]
+    detections['score'] = 1 if scores is None else scores
+    detections['class_id'] = 0 if class_ids is None else class_ids
+    detections['source'] = source
+    return detections
+
+
+def to_xyxy(detections: np.ndarray) -> np.ndarray:
+    boxes = np.empty((len(detections), 4), dtype=np.float32)
+    boxes[:, 0] = detections['x'] - detections['w'] / 2
+    boxes[:, 1] = detections['y'] - detections['h'] / 2
+    boxes[:, 2] = detections['x'] + detections['w'] / 2
+    boxes[:, 3] = detections['y'] + detections['h'] / 2
+    return boxes
+
+
+def to_yolo_labels(detections: np.ndarray, frame_w, frame_h) -> list:
+    """
+    One "class_id x y w h" line per detection, coordinates normalized to the frame size.
+    """
+    return [f"{d['class_id']} {d['x'] / frame_w:.6f} {d['y'] / frame_h:.6f} {d['w'] / frame_w:.6f} {d['h'] / frame_h:.6f}"
+            for d in detections]
+
+
+def match_detections(a: np.ndarray, b: np.ndarray, iou_thres=0.1) -> np.ndarray:
+    """
+    Greedy one-to-one matching by IoU, a pair also matches when the center of the a box lies inside the b box
+    (a small CV blob box inside a YOLO box has a low IoU).
+    return: index of the matched b record for every a record, -1 for none
+    """
+    matches = np.full(len(a), -1, dtype=int)
+    if len(a) == 0 or len(b) == 0:
+        return matches
+    box_a, box_b = to_xyxy(a), to_xyxy(b)
+    inter_w = np.clip(np.minimum(box_a[:, None, 2], box_b[None, :, 2]) -
+                      np.maximum(box_a[:, None, 0], box_b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(box_a[:, None, 3], box_b[None, :, 3]) -
+                      np.maximum(box_a[:, None, 1], box_b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a['w'] * a['h'])[:, None] + (b['w'] * b['h'])[None, :] - inter
+    iou = inter / np.maximum(union, 1e-6)
+    inside = (a['x'][:, None] >= box_b[None, :, 0]) & (a['x'][:, None] <= box_b[None, :, 2]) & \
+             (a['y'][:, None] >= box_b[None, :, 1]) & (a['y'][:, None] <= box_b[None, :, 3])
+    # inside pairs rank above any IoU
+    rank = np.where(inside, 1 + iou, np.where(iou >= iou_thres, iou, -1))
+    b_used = np.zeros(len(b), dtype=bool)
+    for flat in np.argsort(-rank, axis=None):
+        i, j = divmod(int(flat), len(b))
+        if rank[i, j] < 0:
+            break
+        if b_used[j] or matches[i] >= 0:
+            continue
+        b_used[j] = True
+        matches[i] = j
+    return matches
+
+
+def fuse_detections(cv_detections: np.ndarray, yolo_detections: np.ndarray, rule='union', iou_thres=0.1,
+                    cv_weight=0.5, yolo_weight=0.5, min_score=0.6) -> np.ndarray:
+    """
+    Merge the detections of the CV and the YOLO detector of one frame. A matched pair becomes one record with the
+    YOLO box and class.
+        union:  every detection of either detector (recall), a matched pair scores the higher of the two
+        both:   only the matched pairs (precision)
+        vote:   score = cv_weight * cv score + yolo_weight * yolo score (0 for the detector that missed it),
+                records scoring min_score or more are kept. The CV score is always 1, so with min_score above both
+                weights (the default) neither detector passes alone: a spot needs both, and the YOLO score of a
+                pair decides (> 0.2 at the default weights)
+    """
+    matches = match_detections(cv_detections, yolo_detections, iou_thres)
+    matched_cv = matches >= 0
+    matched_yolo = np.zeros(len(yolo_detections), dtype=bool)
+    matched_yolo[matches[matched_cv]] = True
+    pairs = yolo_detections[matches[matched_cv]].copy()
+    cv_only = cv_detections[~matched_cv].copy()
+    yolo_only = yolo_detections[~matched_yolo].copy()
+    if rule == 'both':
+        pairs['score'] = np.maximum(pairs['score'], cv_detections['score'][matched_cv])
+        return pairs
+    if rule == 'vote':
+        pairs['score'] = cv_weight * cv_detections['score'][matched_cv] + yolo_weight * pairs['score']
+        cv_only['score'] *= cv_weight
+        yolo_only['score'] *= yolo_weight
+        fused = np.concatenate((pairs, cv_only, yolo_only))
+        return fused[fused['score'] >= min_score]
+    pairs['score'] = np.maximum(pairs['score'], cv_detections['score'][matched_cv])
+    return np.concatenate((pairs, cv_only, yolo_only))
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import numpy as np
+
+'''
+Frame ring: a fixed set of preallocated frame buffers shared by one producer (capture thread)
+and one consumer (pre-processor).
+
+The producer never writes into the newest committed slot nor into the slot held by the consumer, so
+with at least 3 slots there is always a free slot to decode into and no lock is taken per frame.
+Ownership is negotiated with two flags (_writing / _reading): each side publishes the slot it wants
+first and then checks the other side's flag, so at most one of them ever touches a slot.
+
+Producer:   idx = ring.begin_write() -> decode into ring.slots[idx] -> ring.commit(idx, frame)
+Consumer:   ret, seq, frame, stamp = ring.acquire_latest(timeout) -> use frame -> ring.release()
+'''
+
+
+class FrameRing:
+    MIN_SLOTS = 3
+
+    def __init__(self, num_slots=4, shape=(720, 1280, 3), dtype=np.uint8, new_frame_event: threading.Event = None):
+        num_slots = max(self.MIN_SLOTS, int(num_slots))
+        self.slots = [np.empty(shape, dtype) for _ in range(num_slots)]
+        self.num_slots = num_slots
+        self._slot_seq = [0] * num_slots
+        self._slot_stamp = [0.] * num_slots
+        self._seq = 0  # sequence number of the newest committed frame
+        self._latest = -1  # slot index of the newest committed frame
+        self._write_idx = -1
+        self._writing = -1
+        self._reading = -1
+        self._read_seq = 0  # sequence number of the last frame handed to the consumer
+        self._new_frame = threading.Event()
+        # optional event shared by several rings, lets one consumer wait on any of them
+        self._new_frame_shared = new_frame_event
+        self._consumed = threading.Event()
+
+    # ------------- Producer
+    def begin_write(self) -> int:
+        idx = self._write_idx
+        while True:
+            idx = (idx + 1) % self.num_slots
+            if idx == self._latest:
+                continue
+            self._writing = idx
+            if idx != self._reading:
+                self._write_idx = idx
+                return idx
+            self._writing = -1
+
+    def commit(self, idx: int, frame: np.ndarray = None, stamp: float = None):
+        # cv.VideoCapture.read() re-allocates when the buffer does not match, adopt the new array then
+        if frame is not None and frame is not self.slots[idx]:
+            self.slots[idx] = frame
+        self._seq += 1
+        self._slot_seq[idx] = self._seq
+        self._slot_stamp[idx] = time.time() if stamp is None else stamp
+        self._latest = idx
+        self._writing = -1
+        self._new_frame.set()
+        if self._new_frame_shared is not None:
+            self._new_frame_shared.set()
+
+    def abort(self, idx: int):
+        if self._writing == idx:
+            self._writing = -1
+
+    def wait_for_consumed(self, timeout: float = None) -> bool:
+        # back-pressure for replay sources: block until the consumer took the newest frame
+        self._consumed.clear()
+        if self.has_new():
+            self._consumed.wait(timeout)
+        return not self.has_new()
+
+    # ------------- Consumer
+    def has_new(self) -> bool:
+        return self._seq != self._read_seq
+
+    def wait_for_new(self, timeout: float = None) -> bool:
+        self._new_frame.clear()
+        if not self.has_new():
+            self._new_frame.wait(timeout)
+        return self.has_new()
+
+    def acquire_latest(self, timeout: float = None):
+        """
+        Hold the newest frame until release() or the next acquire_latest().
+        return: (ret, seq, frame, stamp), frame is a view of the ring slot and must not be kept after release().
+        """
+        if not self.has_new() and (timeout is None or not self.wait_for_new(timeout)):
+            return False, self._read_seq, None, 0.
+        while True:
+            idx = self._latest
+            self._reading = idx
+            if self._writing != idx:
+                break
+        seq = self._slot_seq[idx]
+        self._read_seq = seq
+        self._consumed.set()
+        return True, seq, self.slots[idx], self._slot_stamp[idx]
+
+    def release(self):
+        self._reading = -1
+
+    def wake(self):
+        # wake a consumer blocked in wait_for_new() and a producer blocked in wait_for_consumed(), e.g. on shutdown
+        self._new_frame.set()
+        self._consumed.set()
+        if self._new_frame_shared is not None:
+            self._new_frame_shared.set()
+
+
+'''
+Frame pool: per-stage preallocated destination buffers for the processing pipeline.
+
+Each stage owns a small rotation of arrays which are handed out in turn, so a frame written by a stage stays
+valid while up to (depth - 1) newer frames are produced, i.e. while the result is still queued downstream.
+Buffers are only re-created on reset() (e.g. when the crop offsets change) or when the requested shape changes.
+'''
+
+
+class FramePool:
+    def __init__(self, depth=12):
+        self.depth = max(1, int(depth))
+        self._buffers = {}  # stage: [preallocated arrays]
+        self._next = {}  # stage: index of the next buffer to hand out
+
+    def get(self, stage: str, shape, dtype=np.uint8, depth: int = None) -> np.ndarray:
+        buffers = self._buffers.get(stage)
+        if buffers is None or buffers[0].shape != tuple(shape) or buffers[0].dtype != dtype:
+            buffers = [np.empty(shape, dtype) for _ in range(depth or self.depth)]
+            self._buffers[stage] = buffers
+            self._next[stage] = 0
+        idx = self._next[stage]
+        self._next[stage] = (idx + 1) % len(buffers)
+        return buffers[idx]
+
+    def reset(self):
+        self._buffers = {}
+        self._next = {}
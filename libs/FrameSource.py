@@ -0,0 +1,253 @@
+import os
+import time
+from abc import ABC, abstractmethod
+
+import cv2 as cv
+import numpy as np
+
+from libs.Log import Log
+
+'''
+Frame source abstract class: unify where frames come from (camera, gstreamer, recorded footage, synthetic pattern).
+
+Functions to implement:
+    open()
+    read(frame)     frame: optional preallocated buffer to decode into, returns (ret, frame)
+    release()
+    get_size()      returns (width, height)
+
+Live sources drop frames the consumer could not keep up with. Replay sources are "lossless" (every frame is
+handed to the consumer) and run at max speed unless realtime=True, which paces them to the recorded fps.
+'''
+
+
+class FrameSource(ABC):
+    name = 'source'
+    lossless = False  # consumer must take every frame (replay) instead of only the newest one (live)
+
+    @abstractmethod
+    def open(self) -> bool: pass
+
+    @abstractmethod
+    def read(self, frame: np.ndarray = None): pass
+
+    @abstractmethod
+    def release(self): pass
+
+    @abstractmethod
+    def get_size(self): pass
+
+    def is_finished(self) -> bool:
+        return False
+
+    def __str__(self):
+        return self.name
+
+
+class VideoCaptureSource(FrameSource):
+    def __init__(self, source):
+        self.source = source
+        self.cap = None
+
+    def open(self) -> bool:
+        self.cap = cv.VideoCapture(self.source)
+        return self.cap.isOpened()
+
+    def read(self, frame: np.ndarray = None):
+        return self.cap.read(frame)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+    def get_size(self):
+        return int(self.cap.get(cv.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv.CAP_PROP_FRAME_HEIGHT))
+
+
+class CameraSource(VideoCaptureSource):
+    name = 'camera'
+
+    def __init__(self, index=0, width=1280, height=720):
+        super().__init__(index)
+        self.width = width
+        self.height = height
+
+    def open(self) -> bool:
+        ret = super().open()
+        self.cap.set(cv.CAP_PROP_FRAME_WIDTH, self.width)
+        self.cap.set(cv.CAP_PROP_FRAME_HEIGHT, self.height)
+        return ret
+
+    def __str__(self):
+        return f"{self.name}:{self.source}"
+
+
+class GStreamerSource(VideoCaptureSource):
+    name = 'gstreamer'
+
+    def __str__(self):
+        return f"{self.name}:{self.source}"
+
+
+class VideoFileSource(VideoCaptureSource):
+    name = 'video'
+    lossless = True
+
+    def __init__(self, path: str, loop=False, realtime=False):
+        super().__init__(path)
+        self.loop = loop
+        self.realtime = realtime
+        self.frame_interval = 0
+        self.read_timer = 0
+        self.finished = False
+
+    def open(self) -> bool:
+        ret = super().open()
+        fps = self.cap.get(cv.CAP_PROP_FPS)
+        self.frame_interval = 1 / fps if self.realtime and fps > 0 else 0
+        if not ret:
+            Log.error(f"Cannot open video file: {self.source}")
+        return ret
+
+    def read(self, frame: np.ndarray = None):
+        if self.frame_interval > 0:
+            wait = self.frame_interval - (time.time() - self.read_timer)
+            if wait > 0:
+                time.sleep(wait)
+            self.read_timer = time.time()
+        ret, frame = self.cap.read(frame)
+        if not ret and self.loop:
+            self.cap.set(cv.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(frame)
+        self.finished = not ret
+        return ret, frame
+
+    def is_finished(self) -> bool:
+        return self.finished
+
+    def __str__(self):
+        return f"{self.name}:{self.source}"
+
+
+class ImageDirSource(FrameSource):
+    name = 'images'
+    lossless = True
+    IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+    def __init__(self, dir_path: str, loop=False, fps=0):
+        self.dir_path = dir_path
+        self.loop = loop
+        self.frame_interval = 1 / fps if fps > 0 else 0
+        self.read_timer = 0
+        self.files = []
+        self.idx = 0
+        self.size = (0, 0)
+
+    def open(self) -> bool:
+        self.files = []
+        for root, dirs, files in os.walk(self.dir_path):
+            self.files += [os.path.join(root, f) for f in files if f.lower().endswith(self.IMG_EXTENSIONS)]
+        self.files.sort()
+        self.idx = 0
+        if len(self.files) == 0:
+            Log.error(f"No images found in: {self.dir_path}")
+            return False
+        img = cv.imread(self.files[0])
+        self.size = (img.shape[1], img.shape[0])
+        return True
+
+    def read(self, frame: np.ndarray = None):
+        if self.idx >= len(self.files):
+            if not self.loop or len(self.files) == 0:
+                return False, frame
+            self.idx = 0
+        if self.frame_interval > 0:
+            wait = self.frame_interval - (time.time() - self.read_timer)
+            if wait > 0:
+                time.sleep(wait)
+            self.read_timer = time.time()
+        img = cv.imread(self.files[self.idx])
+        self.idx += 1
+        if img is None:
+            Log.warning(f"Cannot read image: {self.files[self.idx - 1]}")
+            return False, frame
+        if frame is not None and frame.shape == img.shape:
+            np.copyto(frame, img)
+            return True, frame
+        return True, img
+
+    def release(self):
+        self.files = []
+
+    def get_size(self):
+        return self.size
+
+    def is_finished(self) -> bool:
+        return not self.loop and self.idx >= len(self.files)
+
+    def __str__(self):
+        return f"{self.name}:{self.dir_path}"
+
+
+class SyntheticSource(FrameSource):
+    """
+    Bright non-woven like texture scrolling down the frame with a few dark flecks on it.
+    """
+    name = 'synthetic'
+
+    def __init__(self, width=1280, height=720, fps=0, num_spots=3, web_speed=8, seed=0):
+        self.width = width
+        self.height = height
+        self.frame_interval = 1 / fps if fps > 0 else 0
+        self.read_timer = 0
+        self.num_spots = num_spots
+        self.web_speed = web_speed  # px per frame
+        self.rng = np.random.default_rng(seed)
+        self.texture = None
+        self.spots = None
+        self.offset = 0
+
+    def open(self) -> bool:
+        noise = self.rng.normal(200, 12, (self.height, self.width)).clip(0, 255).astype(np.uint8)
+        noise = cv.GaussianBlur(noise, (5, 5), 0)
+        self.texture = cv.cvtColor(noise, cv.COLOR_GRAY2BGR)
+        self.spots = np.column_stack((self.rng.uniform(0, self.width, self.num_spots),
+                                      self.rng.uniform(0, self.height, self.num_spots),
+                                      self.rng.uniform(2, 6, self.num_spots)))
+        self.offset = 0
+        return True
+
+    def read(self, frame: np.ndarray = None):
+        if self.frame_interval > 0:
+            wait = self.frame_interval - (time.time() - self.read_timer)
+            if wait > 0:
+                time.sleep(wait)
+            self.read_timer = time.time()
+        if frame is None or frame.shape != self.texture.shape:
+            frame = np.empty_like(self.texture)
+        # scroll the texture without allocating: two slice copies
+        off = self.offset % self.height
+        frame[off:] = self.texture[:self.height - off]
+        frame[:off] = self.texture[self.height - off:]
+        for x, y, r in self.spots:
+            cv.circle(frame, (int(x), int((y + self.offset) % self.height)), int(r), (40, 40, 40), -1, cv.LINE_AA)
+        self.offset += self.web_speed
+        return True, frame
+
+    def release(self):
+        self.texture = None
+
+    def get_size(self):
+        return self.width, self.height
+
+
+def create_frame_source(kind: str, path: str = '', loop=False, realtime=False, sensor_id=0) -> FrameSource:
+    if kind == 'camera':
+        return CameraSource(sensor_id)
+    elif kind == 'video':
+        return VideoFileSource(path, loop=loop, realtime=realtime)
+    elif kind == 'images':
+        return ImageDirSource(path, loop=loop, fps=30 if realtime else 0)
+    elif kind == 'synthetic':
+        return SyntheticSource(fps=60 if realtime else 0)
+    raise ValueError(f"Unknown frame source: {kind}")
@@ -13,10 +13,16 @@ class FunctionPipeline(Debugable):
         for k, func in self.function_pipeline:
             func(**self.function_params[k])
 
-    def execute_pipeline(self, init_state):
+    def execute_pipeline(self, init_state, dst_buffers: dict = None):
+        """
+        dst_buffers: optional {func_idx: preallocated output array}, passed to the function as 'dst'
+        """
         current_state = init_state
         for k, func in self.function_pipeline.items():
-            current_state = func(current_state, **self.function_params[k])
+            if dst_buffers is not None and k in dst_buffers:
+                current_state = func(current_state, **self.function_params[k], dst=dst_buffers[k])
+            else:
+                current_state = func(current_state, **self.function_params[k])
             if current_state is None:
                 print(func.__name__)
             assert current_state is not None
@@ -34,6 +40,8 @@ class FunctionPipeline(Debugable):
         func = self.function_pipeline[func_idx]
         self.function_params[idx] = dict()
         for p_name, p_value in signature(func).parameters.items():
+            if p_name == 'dst':  # output buffer is given per call, see execute_pipeline()
+                continue
             if param_dict is not None and p_name in param_dict:
                 self.function_params[idx][p_name] = param_dict[p_name]
             elif p_value.default is not Parameter.empty:
@@ -1,3 +1,5 @@
+import random
+
 import numpy as np
 import cv2 as cv
 
@@ -37,8 +39,10 @@ def stack_images(scale, img_array):
     return ver
 
 
-def color2gray(frame):
-    return cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+def color2gray(frame, dst=None):
+    if frame.ndim == 2:  # already gray, e.g. GRAY8 straight from the capture pipeline
+        return frame
+    return cv.cvtColor(frame, cv.COLOR_BGR2GRAY, dst=dst)
 
 
 def gray2color(frame):
@@ -52,8 +56,8 @@ def minmax_normalize(frame, norm_min=0, norm_max=255):
     # return out
 
 
-def adjust_contrast(frame, contrast=1):
-    return cv.convertScaleAbs(frame, alpha=contrast, beta=0)
+def adjust_contrast(frame, contrast=1, dst=None):
+    return cv.convertScaleAbs(frame, dst=dst, alpha=contrast, beta=0)
 
 
 def create_conv_kernel(kernel_size, theta):
@@ -94,3 +98,40 @@ def unsharp_mask(frame, kernel_size=(5, 5), sigma=1.0, amount=1.0, threshold=0):
         low_contrast_mask = np.absolute(frame - blurred) < threshold
         np.copyto(sharpened, frame, where=low_contrast_mask)
     return sharpened
+
+
+def plot_one_box(x, img, color=None, label=None, line_thickness=None):
+    """
+    description: Plots one bounding box on image img,
+                 this function comes from YoLov5 project.
+    param:
+        x:      a box likes [x1,y1,x2,y2]
+        img:    an opencv image object
+        color:  color to draw rectangle, such as (0,255,0)
+        label:  str
+        line_thickness: int
+    return:
+        no return
+
+    """
+    tl = (
+            line_thickness or round(0.002 * (img.shape[0] + img.shape[1]) / 2) + 1
+    )  # line/font thickness
+    color = color or [random.randint(0, 255) for _ in range(3)]
+    c1, c2 = (int(x[0]), int(x[1])), (int(x[2]), int(x[3]))
+    cv.rectangle(img, c1, c2, color, thickness=tl, lineType=cv.LINE_AA)
+    if label:
+        tf = max(tl - 1, 1)  # font thickness
+        t_size = cv.getTextSize(label, 0, fontScale=tl / 3, thickness=tf)[0]
+        c2 = c1[0] + t_size[0], c1[1] - t_size[1] - 3
+        cv.rectangle(img, c1, c2, color, -1, cv.LINE_AA)  # filled
+        cv.putText(
+            img,
+            label,
+            (c1[0], c1[1] - 2),
+            0,
+            tl / 3,
+            [225, 255, 255],
+            thickness=tf,
+            lineType=cv.LINE_AA,
+        )
@@ -0,0 +1,72 @@
+import time
+
+import cv2 as cv
+import numpy as np
+
+'''
+Motion gate: tell whether a frame still shows the same scene as the last frame that went through detection,
+e.g. while the fabric line is stopped, so that the previous detections can be reused.
+
+Frames are compared as downsampled thumbnails: every 2nd pixel (of the green channel of a BGR frame) down to twice
+the thumbnail size, INTER_AREA averages the rest (and some of the sensor noise). This reads a quarter of one channel
+(~0.1 ms for 1280x720 BGR, a full INTER_AREA resize of the BGR frame takes ~2 ms).
+unchanged = mean absolute difference < threshold (gray levels). Every refresh_interval seconds a frame is let
+through anyway, so a slow change is never missed for long.
+The thumbnail must keep some of the fabric texture, on a too small one a moving web looks the same as a stopped one
+(320x180 of 1280x720: ~1.7 for sensor noise, ~3 for a web moving 1 pixel per frame, more when it moves faster).
+Every reference gets a new id (reference_id()). The reference frame itself may never reach the detector (dropped by
+a newest-wins buffer, still in flight on the GPU), so detections are only reused for a frame of the same reference.
+'''
+
+
+class MotionGate:
+    def __init__(self, threshold=2.2, refresh_interval=1.0, thumb_size=(320, 180)):
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.thumb_size = thumb_size  # (w, h)
+        self._reference = {}  # key (camera id): thumbnail of the last frame let through
+        self._reference_time = {}
+        self._thumb = {}
+        self._reference_id = {}
+        self._num_references = 0  # not reset, ids stay unique for the detections remembered before a reset
+        self.num_checked = 0
+        self.num_unchanged = 0
+
+    def check(self, key, frame: np.ndarray) -> bool:
+        """
+        return: True if the frame is unchanged, otherwise it becomes the new reference
+        """
+        h, w = frame.shape[:2]
+        stride = max(1, min(w // self.thumb_size[0], h // self.thumb_size[1]) // 2)
+        sampled = frame[::stride, ::stride, 1] if frame.ndim == 3 else frame[::stride, ::stride]
+        thumb = cv.resize(sampled, self.thumb_size, dst=self._thumb.get(key), interpolation=cv.INTER_AREA)
+        self._thumb[key] = thumb
+        self.num_checked += 1
+        reference = self._reference.get(key)
+        now = time.time()
+        if reference is not None and reference.shape == thumb.shape and \
+                now - self._reference_time[key] < self.refresh_interval and \
+                cv.norm(thumb, reference, cv.NORM_L1) / thumb.size < self.threshold:
+            self.num_unchanged += 1
+            return True
+        # swap buffers: the thumbnail becomes the reference, the old reference is reused for the next one
+        self._reference[key], self._thumb[key] = thumb, reference
+        self._reference_time[key] = now
+        self._num_references += 1
+        self._reference_id[key] = self._num_references
+        return False
+
+    def reference_id(self, key) -> int:
+        """
+        return: id of the reference the last checked frame of key was compared with (or became)
+        """
+        return self._reference_id.get(key)
+
+    def reset(self):
+        self._reference = {}
+        self._reference_time = {}
+        self._thumb = {}
+        self._reference_id = {}
+
+    def skip_rate(self) -> float:
+        return self.num_unchanged / self.num_checked if self.num_checked > 0 else 0.
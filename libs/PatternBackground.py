@@ -0,0 +1,131 @@
+import cv2 as cv
+import numpy as np
+
+'''
+Pattern background model: removes the print of a patterned fabric from a (gray) frame, so that the blob detector
+only sees what does not belong to the pattern. Learned while the line runs, one model per camera.
+
+The print of a fabric repeats along the direction it moves (axis, 0: the web moves along the image rows / top to
+bottom, 1: left to right). The repeat length (period, px) is taken from the autocorrelation of the frame profile
+along the web in num_bands bands across it (one profile over the full width would average a 2D print away),
+averaged over frames (learning_rate) and re-estimated every period_interval frames. Profiles varying less than
+min_contrast (std, gray levels) have no print, the few flecks on them would make up a period:
+
+    residual(p) = min(|f(p) - f(p - period)|, |f(p) - f(p + period)|)
+
+A fleck differs from the pattern one period away on both sides, its copies in the neighbouring repeats only on
+one side, so they cancel in the min. Stripes along the web and uneven lighting across it cancel as well.
+Without a clear period (plain fabric) the running cross-web profile (mean of every column along the web) is the
+background: residual = |f - profile|.
+
+Residual values below the noise floor (mean + noise_sigma * std of the residual) are set to 0. The blob detector
+thresholds the image at many levels, and on a residual full of sensor noise it would trace thousands of tiny
+contours at the low levels.
+'''
+
+
+class PatternBackgroundModel:
+    def __init__(self, axis=0, min_period=8, max_period=256, min_correlation=0.3, min_contrast=2., learning_rate=0.05,
+                 period_interval=10, noise_sigma=3., num_bands=32):
+        self.axis = axis
+        self.min_period = min_period
+        self.max_period = max_period
+        self.min_correlation = min_correlation  # normalized autocorrelation needed to accept a period
+        self.min_contrast = min_contrast
+        self.learning_rate = learning_rate
+        self.period_interval = period_interval
+        self.noise_sigma = noise_sigma
+        self.num_bands = num_bands
+        self.reset()
+
+    def reset(self):
+        self.shape = None
+        self.autocorr = None
+        self.profile = None
+        self.period = 0  # 0: no period found, the cross-web profile is used
+        self.num_frames = 0
+        self._background = None
+        self._residual = None
+        self._diff = None
+
+    def learn(self, frame: np.ndarray):
+        a = self.learning_rate if self.num_frames > 0 else 1.
+        # cross-web profile: mean of every line along the web
+        profile = cv.reduce(frame, self.axis, cv.REDUCE_AVG, dtype=cv.CV_32F)
+        self.profile = profile if self.profile is None else cv.addWeighted(self.profile, 1 - a, profile, a, 0)
+        if self.num_frames % self.period_interval == 0:
+            # band profiles along the web (rows: bands), their mean autocorrelation (zero padded FFT) normalized
+            # by the overlap length
+            n = frame.shape[self.axis]
+            bands = min(self.num_bands, frame.shape[1 - self.axis])
+            lines = cv.resize(frame, (bands, n) if self.axis == 0 else (n, bands), interpolation=cv.INTER_AREA)
+            lines = lines.T.astype(np.float32) if self.axis == 0 else lines.astype(np.float32)
+            lines -= lines.mean(axis=1, keepdims=True)
+            spectrum = np.fft.rfft(lines, 2 * n, axis=1)
+            power = (spectrum.real ** 2 + spectrum.imag ** 2).mean(axis=0)
+            autocorr = np.fft.irfft(power)[:n] / np.arange(n, 0, -1)
+            if autocorr[0] > self.min_contrast ** 2:
+                autocorr /= autocorr[0]
+            else:
+                autocorr[:] = 0
+            if self.autocorr is None:
+                self.autocorr = autocorr
+            else:
+                b = min(self.learning_rate * self.period_interval, 1.)
+                self.autocorr = (1 - b) * self.autocorr + b * autocorr
+            self.period = self.estimate_period(self.autocorr)
+        self.num_frames += 1
+
+    def estimate_period(self, autocorr: np.ndarray) -> int:
+        # the shortest lag with (close to) the highest correlation, not one of its multiples
+        hi = min(self.max_period, len(autocorr) // 2)
+        if hi <= self.min_period + 1:
+            return 0
+        window = autocorr[self.min_period:hi + 1]
+        peaks = np.flatnonzero((window[1:-1] >= window[:-2]) & (window[1:-1] >= window[2:])) + 1
+        if len(peaks) == 0:
+            return 0
+        best = window[peaks].max()
+        if best < self.min_correlation:
+            return 0
+        return int(peaks[window[peaks] >= 0.9 * best][0]) + self.min_period
+
+    def subtract(self, frame: np.ndarray) -> np.ndarray:
+        """
+        param: frame: gray uint8 frame
+        return: residual (uint8, buffer reused by the next call), bright where the frame differs from the pattern
+        """
+        if frame.shape != self.shape:
+            self.reset()
+            self.shape = frame.shape
+            self._residual = np.empty_like(frame)
+            self._diff = np.empty_like(frame)
+        self.learn(frame)
+        p = self.period
+        if p == 0:
+            # plain fabric: the cross-web profile repeated along the web
+            profile = np.clip(self.profile, 0, 255).astype(np.uint8)
+            reps = (frame.shape[0], 1) if self.axis == 0 else (1, frame.shape[1])
+            self._background = cv.repeat(profile, reps[0], reps[1], dst=self._background)
+            cv.absdiff(frame, self._background, dst=self._residual)
+            return self.suppress_noise(self._residual)
+        n = frame.shape[self.axis]
+        f, r, d = frame, self._residual, self._diff
+        lines = self.lines
+        # |f(p) - f(p - period)| for all lines with a predecessor, the first period lines only have a successor
+        cv.absdiff(lines(f, p, n), lines(f, 0, n - p), dst=lines(r, p, n))
+        cv.absdiff(lines(f, 0, p), lines(f, p, 2 * p), dst=lines(r, 0, p))
+        # min with |f(p) - f(p + period)|, the last period lines only have a predecessor
+        cv.absdiff(lines(f, 0, n - p), lines(f, p, n), dst=lines(d, 0, n - p))
+        cv.min(lines(r, 0, n - p), lines(d, 0, n - p), dst=lines(r, 0, n - p))
+        return self.suppress_noise(self._residual)
+
+    def suppress_noise(self, residual: np.ndarray) -> np.ndarray:
+        mean, std = cv.meanStdDev(residual)
+        floor = float(mean[0, 0] + self.noise_sigma * std[0, 0])
+        cv.threshold(residual, floor, 0, cv.THRESH_TOZERO, dst=residual)
+        return residual
+
+    def lines(self, arr: np.ndarray, start: int, stop: int) -> np.ndarray:
+        # view of the lines start:stop along the web
+        return arr[start:stop] if self.axis == 0 else arr[:, start:stop]
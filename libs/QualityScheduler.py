@@ -0,0 +1,161 @@
+'''
+Quality scheduler: hold a target frame rate by switching between operating points, instead of an operator changing
+the detection mode by hand when the line speeds up or the Nano throttles when it heats up.
+
+The operating points are ordered from the best quality (first) to the cheapest (last). Each is a detection mode
+(cv | yolo | cascade | fused), an input scale of the cropped frames, YOLO tiling on / off and a frame skip (frames of a
+camera dropped after each processed one). A scale below 1 loses the smallest flecks (the blob detector drops
+contours of a few pixels), so the cheap points skip frames first: with strip stitching (see StripStitcher.py) a
+skipped frame costs no coverage as long as the web moves less than a frame in between.
+The results are measured over windows of `window` seconds. A window is too slow when:
+    - the result rate per camera stays below target_fps (or the capture rate, if that is lower) / (1 + frame skip)
+      by more than the tolerance
+    - fabric passed without inspection (the strip stitching coverage of a camera dropped)
+    - the mean capture to post-processing latency exceeds max_latency (ms, 0: no limit)
+A slow window moves to the next cheaper point. After upgrade_delay seconds without a slow window the next better
+point is tried. If it fails, its delay doubles (up to max_upgrade_delay), so the scheduler does not keep switching
+back and forth at the edge of what the hardware can do. The first window after a switch is not judged, the
+detectors need it to settle (TensorRT warm up, buffers of the other mode).
+seed() starts over from a point chosen outside the scheduler, e.g. the best point of the mode the operator selected.
+'''
+
+
+class OperatingPoint:
+    __slots__ = ('name', 'mode', 'input_scale', 'tiling', 'frame_skip')
+
+    def __init__(self, name: str, mode='cv', input_scale=1.0, tiling=False, frame_skip=0):
+        self.name = name
+        self.mode = mode
+        self.input_scale = input_scale
+        self.tiling = tiling
+        self.frame_skip = frame_skip
+
+    def __repr__(self):
+        return f"{self.name} (mode {self.mode}, scale {self.input_scale}, tiling {self.tiling}, " \
+               f"frame skip {self.frame_skip})"
+
+
+class QualityScheduler:
+    def __init__(self, points: list, target_fps=10., tolerance=0.1, max_latency=0., window=3., upgrade_delay=30.,
+                 max_upgrade_delay=600.):
+        self.points = points
+        self.target_fps = target_fps  # results per second and camera
+        self.tolerance = tolerance
+        self.max_latency = max_latency
+        self.window = window  # sec
+        self.upgrade_delay = upgrade_delay  # sec
+        self.max_upgrade_delay = max_upgrade_delay
+        self.upgrade_delays = [upgrade_delay] * len(points)  # wait before moving up to each point
+        self.index = 0
+        self.probing = False  # the current point was reached by an upgrade that has not held yet
+        self.settling = True
+        self.switch_time = 0.
+        self.healthy_since = None
+        self.num_switches = 0
+        self.reset_window(0.)
+
+    def reset_window(self, now: float):
+        self.window_start = now
+        self.num_results = 0
+        self.cameras = set()
+        self.latency_sums = {}  # stage: ms
+        self.capture_fps_sum = 0.
+        self.coverage_start = {}  # camera id: coverage at the first result of the window
+        self.coverage_end = {}
+
+    def current(self) -> OperatingPoint:
+        return self.points[self.index]
+
+    def find_mode(self, mode: str):
+        """
+        return: index of the best point of the detection mode, None if there is none
+        """
+        return next((i for i, point in enumerate(self.points) if point.mode == mode), None)
+
+    def observe(self, camera_id, latencies: dict, coverage=None, capture_fps=0.):
+        """
+        param:
+            latencies: {stage: ms} of one result
+            coverage: inspected / travelled fabric length of the camera, None without strip stitching
+            capture_fps: frame rate of the camera
+        """
+        self.num_results += 1
+        self.cameras.add(camera_id)
+        for stage, latency in latencies.items():
+            self.latency_sums[stage] = self.latency_sums.get(stage, 0.) + latency
+        self.capture_fps_sum += capture_fps
+        if coverage is not None:
+            self.coverage_start.setdefault(camera_id, coverage)
+            self.coverage_end[camera_id] = coverage
+
+    def window_stats(self, now: float) -> dict:
+        n = max(1, self.num_results)
+        return {'fps': self.num_results / max(now - self.window_start, 1e-3) / max(1, len(self.cameras)),
+                'capture_fps': self.capture_fps_sum / n,
+                'latencies': {stage: latency / n for stage, latency in self.latency_sums.items()},
+                'gaps': any(self.coverage_end[cam] < start - 1e-9 for cam, start in self.coverage_start.items())}
+
+    def too_slow(self, stats: dict):
+        """
+        return: why the window was too slow, None if it was not
+        """
+        point = self.current()
+        target = self.target_fps
+        if stats['capture_fps'] > 0:
+            # a camera slower than the target is no reason to lower the quality
+            target = min(target, stats['capture_fps'])
+        target /= 1 + point.frame_skip
+        if stats['fps'] < target * (1 - self.tolerance):
+            return f"{round(stats['fps'], 1)} FPS < {round(target, 1)} FPS"
+        if stats['gaps']:
+            return "fabric passed without inspection"
+        latency = sum(stats['latencies'].values())
+        if 0 < self.max_latency < latency:
+            return f"latency {round(latency)} ms > {round(self.max_latency)} ms"
+        return None
+
+    def update(self, now: float):
+        """
+        Judge the window once it is over.
+        return: (reason, window stats) if the operating point changed (see current()), otherwise None
+        """
+        if now - self.window_start < self.window:
+            return None
+        stats = self.window_stats(now)
+        self.reset_window(now)
+        if self.settling:
+            self.settling = False
+            return None
+        reason = self.too_slow(stats)
+        if reason is not None:
+            self.healthy_since = None
+            if self.probing:
+                # the upgrade did not hold: wait longer before trying this point again
+                self.upgrade_delays[self.index] = min(2 * self.upgrade_delays[self.index], self.max_upgrade_delay)
+            if self.index == len(self.points) - 1:
+                return None
+            self.switch(self.index + 1, now, probing=False)
+            return reason, stats
+        if self.healthy_since is None:
+            self.healthy_since = now - self.window
+        if self.probing and now - self.switch_time >= self.upgrade_delay:
+            self.probing = False
+            self.upgrade_delays[self.index] = self.upgrade_delay
+        if self.index > 0 and now - self.healthy_since >= self.upgrade_delays[self.index - 1]:
+            reason = f"{round(stats['fps'], 1)} FPS held for {round(now - self.healthy_since)} s"
+            self.switch(self.index - 1, now, probing=True)
+            return reason, stats
+        return None
+
+    def switch(self, index: int, now: float, probing: bool):
+        self.seed(index, now)
+        self.probing = probing
+        self.num_switches += 1
+
+    def seed(self, index: int, now: float):
+        self.index = index
+        self.probing = False
+        self.settling = True
+        self.switch_time = now
+        self.healthy_since = None
+        self.reset_window(now)
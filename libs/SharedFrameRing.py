@@ -0,0 +1,72 @@
+import numpy as np
+
+from libs.Log import Log
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+'''
+Shared frame ring: fixed size frame slots in one shared memory block, hands frames between processes without
+pickling them. Only the slot index and the array layout travel through a pipe / queue.
+
+Producer:   idx = free_slots.get() -> layout = ring.write(idx, [raw, processed]) -> send (idx, layout, metadata)
+Consumer:   raw, processed = ring.read(idx, layout) -> use / copy -> free_slots.put(idx)
+
+A slot belongs to whichever process holds its index, so the block itself needs no lock.
+The process creating the ring (name=None) owns the block and unlinks it on close(), the others attach by name.
+'''
+
+
+def shared_memory_available() -> bool:
+    return shared_memory is not None
+
+
+class SharedFrameRing:
+    ALIGN = 64  # bytes, start of every array in a slot
+
+    def __init__(self, num_slots=6, slot_bytes=1280 * 720 * 3 * 2, name: str = None):
+        if shared_memory is None:
+            raise RuntimeError("multiprocessing.shared_memory requires Python 3.8 or newer")
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=num_slots * slot_bytes)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, idx: int, arrays: list):
+        """
+        Copy the arrays (None entries allowed) into slot idx.
+        return: layout to hand to read(), None if the arrays do not fit into a slot
+        """
+        layout = []
+        offset = 0
+        for arr in arrays:
+            if arr is None:
+                layout.append(None)
+                continue
+            if offset + arr.nbytes > self.slot_bytes:
+                return None
+            dst = np.ndarray(arr.shape, arr.dtype, self.shm.buf, idx * self.slot_bytes + offset)
+            np.copyto(dst, arr)
+            layout.append((offset, arr.shape, arr.dtype.str))
+            offset += -(-arr.nbytes // self.ALIGN) * self.ALIGN
+        return layout
+
+    def read(self, idx: int, layout: list) -> list:
+        # views into the shared block, only valid while the slot is held
+        return [None if item is None else
+                np.ndarray(item[1], np.dtype(item[2]), self.shm.buf, idx * self.slot_bytes + item[0])
+                for item in layout]
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            Log.warning("Shared frame ring closed while frames are still in use.")
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,160 @@
+import numpy as np
+
+'''
+Spot tracker: follow detections (see Detections.py) from frame to frame so that one fleck passing through the field
+of view is one spot with a persistent id, instead of one alarm / saved image per frame.
+
+Association is greedy nearest-centroid within a gate, between the detections and the positions predicted by each
+track's velocity. All spots ride on the same fabric, so the web velocity (median of the matched tracks) is
+tracked as well and new tracks start with it; when the line stops it decays to 0 with the measurements.
+
+A track is confirmed after min_hits matches and ends after max_misses frames without a match. The track keeps the
+quality (score, halved when the box touches the frame border) of its best detection, `improved` tells the caller
+when to keep the current frame as the track's best one (payload). Only views of confirmed tracks are kept (most
+tracks are noise that never gets confirmed): the confirming frame is the first one, later ones replace it when better.
+'''
+
+
+class SpotTrack:
+    __slots__ = ('track_id', 'class_id', 'x', 'y', 'w', 'h', 'vx', 'vy', 'last_time', 'hits', 'misses',
+                 'confirmed', 'best_quality', 'improved', 'payload')
+
+    def __init__(self, track_id: int, detection, timestamp: float, velocity):
+        self.track_id = track_id
+        self.class_id = int(detection['class_id'])
+        self.x = float(detection['x'])
+        self.y = float(detection['y'])
+        self.w = float(detection['w'])
+        self.h = float(detection['h'])
+        self.vx, self.vy = float(velocity[0]), float(velocity[1])
+        self.last_time = timestamp
+        self.hits = 1
+        self.misses = 0
+        self.confirmed = False
+        self.best_quality = -1.
+        self.improved = False
+        self.payload = None  # whatever the caller keeps for the best detection, e.g. the frame to save
+
+    def predict(self, timestamp: float):
+        dt = timestamp - self.last_time
+        return self.x + self.vx * dt, self.y + self.vy * dt
+
+
+class SpotTracker:
+    def __init__(self, min_hits=3, max_misses=5, gate=40., velocity_smoothing=0.3):
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self.gate = gate  # px, max distance between predicted and detected center
+        self.velocity_smoothing = velocity_smoothing  # weight of a new velocity measurement
+        self.tracks = []
+        self.web_velocity = np.zeros(2)  # px / sec
+        self.next_id = 1
+        self.newly_confirmed = []  # confirmed by the last update()
+        self.finished = []  # confirmed tracks that ended in the last update()
+
+    @staticmethod
+    def quality(detection, frame_w, frame_h) -> float:
+        x1 = detection['x'] - detection['w'] / 2
+        y1 = detection['y'] - detection['h'] / 2
+        x2 = detection['x'] + detection['w'] / 2
+        y2 = detection['y'] + detection['h'] / 2
+        inside = x1 > 0 and y1 > 0 and x2 < frame_w - 1 and y2 < frame_h - 1
+        return float(detection['score']) * (1. if inside else .5)
+
+    def associate(self, detections, timestamp: float) -> np.ndarray:
+        """
+        return: index of the matched track for every detection, -1 for none
+        """
+        matches = np.full(len(detections), -1, dtype=int)
+        if len(self.tracks) == 0 or len(detections) == 0:
+            return matches
+        predicted = np.array([track.predict(timestamp) for track in self.tracks])
+        track_class = np.array([track.class_id for track in self.tracks])
+        centers = np.column_stack((detections['x'], detections['y'])).astype(np.float64)
+        dist = np.linalg.norm(predicted[:, None, :] - centers[None, :, :], axis=2)
+        dist[track_class[:, None] != detections['class_id'][None, :]] = np.inf
+        track_used = np.zeros(len(self.tracks), dtype=bool)
+        for flat in np.argsort(dist, axis=None):
+            t, d = divmod(int(flat), len(detections))
+            if dist[t, d] > self.gate:
+                break
+            if track_used[t] or matches[d] >= 0:
+                continue
+            track_used[t] = True
+            matches[d] = t
+        return matches
+
+    def update(self, detections, timestamp: float, frame_w: int, frame_h: int) -> list:
+        """
+        param:
+            detections: DETECTION_DTYPE records of one frame
+            timestamp: capture time of the frame
+        return: the track of every detection
+        """
+        self.newly_confirmed = []
+        self.finished = []
+        matches = self.associate(detections, timestamp)
+        a = self.velocity_smoothing
+        # web velocity from the tracks matched in this frame
+        measured = []
+        for d, t in enumerate(matches):
+            if t >= 0:
+                track = self.tracks[t]
+                dt = max(timestamp - track.last_time, 1e-3)
+                measured.append(((detections['x'][d] - track.x) / dt, (detections['y'][d] - track.y) / dt))
+        if len(measured) > 0:
+            self.web_velocity = (1 - a) * self.web_velocity + a * np.median(np.array(measured), axis=0)
+
+        matched = np.zeros(len(self.tracks), dtype=bool)
+        result = []
+        for d, t in enumerate(matches):
+            detection = detections[d]
+            if t >= 0:
+                track = self.tracks[t]
+                matched[t] = True
+                dt = max(timestamp - track.last_time, 1e-3)
+                track.vx = (1 - a) * track.vx + a * (float(detection['x']) - track.x) / dt
+                track.vy = (1 - a) * track.vy + a * (float(detection['y']) - track.y) / dt
+                track.x, track.y = float(detection['x']), float(detection['y'])
+                track.w, track.h = float(detection['w']), float(detection['h'])
+                track.last_time = timestamp
+                track.hits += 1
+                track.misses = 0
+            else:
+                track = SpotTrack(self.next_id, detection, timestamp, self.web_velocity)
+                self.next_id += 1
+                self.tracks.append(track)
+            quality = self.quality(detection, frame_w, frame_h)
+            track.improved = track.confirmed and quality > track.best_quality
+            if track.improved:
+                track.best_quality = quality
+            if not track.confirmed and track.hits >= self.min_hits:
+                track.confirmed = True
+                track.improved = True
+                track.best_quality = quality
+                self.newly_confirmed.append(track)
+            result.append(track)
+
+        alive = []
+        for t, track in enumerate(self.tracks):
+            if t < len(matched) and not matched[t]:
+                track.improved = False
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    if track.confirmed:
+                        self.finished.append(track)
+                    continue
+            alive.append(track)
+        self.tracks = alive
+        return result
+
+    def has_confirmed(self) -> bool:
+        return any(track.confirmed for track in self.tracks)
+
+    def flush(self) -> list:
+        """
+        End every track, return the confirmed ones.
+        """
+        finished = [track for track in self.tracks if track.confirmed]
+        self.tracks = []
+        return finished
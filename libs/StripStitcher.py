@@ -0,0 +1,188 @@
+import cv2 as cv
+import numpy as np
+
+from libs.Detections import empty_detections
+
+'''
+Strip stitching: inspect every line of the moving fabric once, instead of every frame in full. At a few pixels of
+web movement per frame most of a frame was already inspected in the previous one, so the detection cost follows the
+fabric speed, not the frame rate.
+
+WebDisplacement (pre-processor): position of the web along its axis (0: the web moves along the image rows / top to
+bottom, 1: left to right), px at frame resolution, summed from the shift between consecutive frames of a camera.
+The shift is the phase correlation (cv.phaseCorrelate) of a band along the middle of the frames, downsampled by
+scale (INTER_AREA; 1/2 of a band 1/4 of the frame wide: ~1 ms per 1280x720 frame). Frames are correlated with a key
+frame, not with the previous frame, which is replaced once its correlation peak drops below keyframe_response or the
+web moved keyframe_shift of the band length: the sub-pixel error of a shift (a few 0.1 px, the same sign at the same
+speed) then adds up once per key frame instead of once per frame (at 1/2: a few px per 300 frames, 1/4 drifts ~5x
+more). Without a clear correlation peak (blur, the web moved further than the band overlaps) the last web speed is
+used, and a shift below dead_band is sensor noise of a stopped line.
+
+FabricCoverage (detector, one per camera): the lines that came into view since the last inspected frame are the
+strip to inspect, margin lines in from the edge where the fabric enters, so that the spots are whole when they are
+inspected. Only spots centred in the strip are new, the ones found before are carried along with the web until they
+leave the frame, so that every frame still shows (and the spot tracker still sees) all spots in view.
+A strip longer than the frame minus the margins means fabric passed without being inspected (the detector is too
+slow for the line speed): the gap is counted, and coverage = inspected / travelled fabric length.
+'''
+
+
+class WebDisplacement:
+    def __init__(self, axis=0, scale=0.5, band=0.25, min_response=0.1, dead_band=0.5, keyframe_response=0.3,
+                 keyframe_shift=0.25, speed_smoothing=0.3):
+        self.axis = axis
+        self.scale = scale
+        self.band = band  # part of the frame across the web that is correlated
+        self.min_response = min_response  # phase correlation peak needed to trust a shift
+        self.dead_band = dead_band  # px
+        self.keyframe_response = keyframe_response
+        self.keyframe_shift = keyframe_shift
+        self.speed_smoothing = speed_smoothing  # weight of a new speed measurement
+        self.reset()
+
+    def reset(self):
+        self._reference = {}  # key (camera id): downsampled band of the key frame
+        self._reference_position = {}
+        self._window = {}
+        self._last_time = {}
+        self.position = {}  # key: px
+        self.speed = {}  # key: px / sec
+
+    def downsample(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        if self.axis == 0:
+            side = int(w * (1 - self.band) / 2)
+            roi = frame[:, side:w - side]
+        else:
+            side = int(h * (1 - self.band) / 2)
+            roi = frame[side:h - side]
+        small = cv.resize(roi, None, fx=self.scale, fy=self.scale, interpolation=cv.INTER_AREA)
+        if small.ndim == 3:
+            small = cv.cvtColor(small, cv.COLOR_BGR2GRAY)
+        return small.astype(np.float32)
+
+    def update(self, key, frame: np.ndarray, timestamp: float) -> float:
+        """
+        param:
+            frame: cropped frame (gray or BGR)
+            timestamp: capture time of the frame
+        return: position of the web when the frame was captured
+        """
+        current = self.downsample(frame)
+        reference = self._reference.get(key)
+        last_position = self.position.get(key, 0.)
+        position = last_position
+        new_key = True
+        if reference is None or reference.shape != current.shape:
+            self._window[key] = cv.createHanningWindow((current.shape[1], current.shape[0]), cv.CV_32F)
+            self.speed[key] = 0.
+        else:
+            dt = max(timestamp - self._last_time[key], 1e-3)
+            shift, response = cv.phaseCorrelate(reference, current, self._window[key])
+            if response >= self.min_response:
+                moved = shift[1 - self.axis] / self.scale
+                if abs(moved) < self.dead_band:
+                    moved = 0.
+                position = self._reference_position[key] + moved
+                self.speed[key] += self.speed_smoothing * ((position - last_position) / dt - self.speed[key])
+                new_key = response < self.keyframe_response or \
+                    abs(shift[1 - self.axis]) > self.keyframe_shift * current.shape[self.axis]
+            else:
+                position += self.speed[key] * dt
+        if new_key:
+            self._reference[key] = current
+            self._reference_position[key] = position
+        self._last_time[key] = timestamp
+        self.position[key] = position
+        return position
+
+
+class FabricCoverage:
+    def __init__(self, axis=0, margin=16, min_strip_fraction=0.):
+        self.axis = axis
+        self.field = 'y' if axis == 0 else 'x'
+        self.margin = margin  # px
+        self.min_strip_fraction = min_strip_fraction  # of the inspectable length, 0: any new line
+        self.reset()
+
+    def reset(self):
+        self.frame_length = 0
+        self.last_position = None  # web position of the last inspected frame
+        self.carried = empty_detections()
+        self.carried_lines = np.empty(0)  # fabric coordinate of every carried spot: frame coordinate - position
+        self.travelled = 0.  # px
+        self.inspected = 0.
+        self.gap = 0.
+        self.num_gaps = 0
+        self.last_gap = 0.
+
+    def frame_margin(self, frame_length: int) -> int:
+        """
+        return: the margin in a frame of frame_length lines, at most a quarter of it
+        """
+        return min(self.margin, frame_length // 4)
+
+    def plan(self, position: float, frame_length: int):
+        """
+        param: frame_length: lines of the frame along the web
+        return: (start, stop) lines of the frame to inspect, None: too little new fabric, nothing to inspect
+        """
+        margin = self.frame_margin(frame_length)
+        usable = frame_length - 2 * margin
+        self.last_gap = 0.
+        if self.last_position is None or frame_length != self.frame_length:
+            # first frame: everything between the margins
+            self.reset()
+            self.frame_length = frame_length
+            self.last_position = position
+            self.travelled += usable
+            self.inspected += usable
+            return margin, frame_length - margin
+        # whole lines, the rest is left for the next strip
+        moved = int(round(position - self.last_position))
+        if abs(moved) < max(1, self.min_strip_fraction * usable):
+            return None
+        self.last_position += moved
+        length = min(abs(moved), usable)
+        self.travelled += abs(moved)
+        self.inspected += length
+        if abs(moved) > length:
+            self.last_gap = abs(moved) - length
+            self.gap += self.last_gap
+            self.num_gaps += 1
+        # the fabric enters at the top / left when the web moves forward
+        if moved > 0:
+            return margin, margin + length
+        return frame_length - margin - length, frame_length - margin
+
+    def window(self, strip) -> tuple:
+        """
+        return: the strip with the margin on both sides, the part of the frame to search
+        """
+        start, stop = strip
+        margin = self.frame_margin(self.frame_length)
+        return max(0, start - margin), min(self.frame_length, stop + margin)
+
+    def add(self, detections: np.ndarray, position: float, strip):
+        """
+        Keep the detections centred in the strip, they are carried along with the web from now on.
+        """
+        lines = detections[self.field]
+        new = detections[(lines >= strip[0]) & (lines < strip[1])]
+        self.carried = np.concatenate((self.carried, new))
+        self.carried_lines = np.concatenate((self.carried_lines, new[self.field] - position))
+
+    def carry(self, position: float) -> np.ndarray:
+        """
+        return: the carried spots at the position of the web, the ones that left the frame are dropped
+        """
+        lines = self.carried_lines + position
+        visible = (lines >= 0) & (lines < self.frame_length)
+        self.carried = self.carried[visible]
+        self.carried_lines = self.carried_lines[visible]
+        detections = self.carried.copy()
+        detections[self.field] = lines[visible]
+        return detections
+
+    def coverage(self) -> float:
+        return self.inspected / self.travelled if self.travelled > 0 else 1.
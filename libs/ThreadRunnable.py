@@ -1,5 +1,5 @@
 import time
-from threading import Thread
+from threading import Thread, Event
 import signal
 from abc import ABC, abstractmethod
 
@@ -9,6 +9,11 @@ Runnable thread abstract class: unify thread executing.
 Execution process: on_start() -> main_body() loop -> on_end(). 
 This class also needs to handle interrupt signals(SIGTERM and SIGINT) so that the thread can exit nicely. 
 
+Wait-for-input mode: set wait_timeout and override wait_for_input() (block until there is work) and wake()
+(release that wait), main_body() is then only called when there is something to do and an idle stage takes no CPU.
+thread_stop() sets stop_event and calls wake(), so sleeping threads exit right away; use sleep() instead of
+time.sleep() in main_body() for the same reason.
+
 Functions to implement:
     on_start()
     main_body()
@@ -23,6 +28,8 @@ class ThreadRunnable(ABC):
         signal.signal(signal.SIGINT, self._exit_nicely)
         signal.signal(signal.SIGTERM, self._exit_nicely)
         self.loop_run = True
+        self.stop_event = Event()
+        self.wait_timeout = None  # seconds, enables the wait-for-input mode
         self.thread = Thread(target=self.thread_function, args=())
 
     def set_daemon(self):
@@ -33,22 +40,40 @@ class ThreadRunnable(ABC):
 
     def thread_start(self):
         self.loop_run = True
+        self.stop_event.clear()
         self.thread.start()
 
     def thread_run(self):
         self.loop_run = True
+        self.stop_event.clear()
         self.thread.run()
 
     def thread_stop(self):
         self.loop_run = False
+        self.stop_event.set()
+        self.wake()
 
     def thread_join(self):
         self.thread.join()
 
     def _exit_nicely(self, *args):
         self.loop_run = False
+        self.stop_event.set()
+        self.wake()
         self.exit_nicely(*args)
 
+    def wait_for_input(self, timeout: float) -> bool:
+        # wait-for-input mode: block until main_body() has work, False skips this round
+        return True
+
+    def wake(self):
+        # release whatever wait_for_input() blocks on
+        pass
+
+    def sleep(self, seconds: float) -> bool:
+        # interruptible sleep, returns False if the thread was stopped meanwhile
+        return not self.stop_event.wait(seconds)
+
     @abstractmethod
     def exit_nicely(self, *args): pass
 
@@ -64,7 +89,8 @@ class ThreadRunnable(ABC):
     def thread_function(self):
         self.on_start()
         while self.loop_run:
-            self.main_body()
+            if self.wait_timeout is None or self.wait_for_input(self.wait_timeout):
+                self.main_body()
         self.on_end()
 
 
@@ -102,24 +102,53 @@ def gstreamer_pipeline(
         display_height=720,
         frame_rate=60,
         flip_method=2,
+        crop_left=0,
+        crop_right=0,
+        crop_top=0,
+        crop_bottom=0,
+        scale=1.0,
+        gray=False,
 ):
+    """
+    Crop margins are given in output (flipped) frame coordinates and are done by nvvidconv on the VIC,
+    as is the optional down scale. gray=True outputs GRAY8 straight from nvvidconv and skips videoconvert.
+    """
+    crop = ""
+    if crop_left or crop_right or crop_top or crop_bottom:
+        # nvvidconv crops the input, i.e. before flipping: map the margins back to sensor orientation
+        if flip_method in (2, 4):  # rotate-180, horizontal flip
+            crop_left, crop_right = crop_right, crop_left
+        if flip_method in (2, 6):  # rotate-180, vertical flip
+            crop_top, crop_bottom = crop_bottom, crop_top
+        crop = "left=%d right=%d top=%d bottom=%d " % (
+            crop_left, capture_width - crop_right, crop_top, capture_height - crop_bottom)
+        display_width = capture_width - crop_left - crop_right
+        display_height = capture_height - crop_top - crop_bottom
+    # nvvidconv requires even output dimensions
+    display_width = int(display_width * scale) // 2 * 2
+    display_height = int(display_height * scale) // 2 * 2
+    if gray:
+        convert = "video/x-raw, width=(int)%d, height=(int)%d, format=(string)GRAY8 ! appsink" % (
+            display_width, display_height)
+    else:
+        convert = ("video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! "
+                   "videoconvert ! "
+                   "video/x-raw, format=(string)BGR ! appsink" % (display_width, display_height))
     return (
             "nvarguscamerasrc sensor-id=%d ! "
             "video/x-raw(memory:NVMM), "
             "width=(int)%d, height=(int)%d, "
             "format=(string)NV12, framerate=(fraction)%d/1 ! "
-            "nvvidconv flip-method=%d ! "
-            "video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! "
-            "videoconvert ! "
-            "video/x-raw, format=(string)BGR ! appsink"
+            "nvvidconv flip-method=%d %s! "
+            "%s"
             % (
                 sensor_id,
                 capture_width,
                 capture_height,
                 frame_rate,
                 flip_method,
-                display_width,
-                display_height,
+                crop,
+                convert,
             )
     )
 
@@ -130,7 +159,8 @@ def gstreamer_pipeline(
 def draw_cv_keypoints_on_frame(keypoints, img):
     # tl = round(0.002 * (img.shape[0] + img.shape[1]) / 2) + 1
     tl = 1
-    img = cv.cvtColor(img, cv.COLOR_GRAY2BGR)
+    if img.ndim == 2:
+        img = cv.cvtColor(img, cv.COLOR_GRAY2BGR)
     for kp in keypoints:
         # color = [random.randint(0, 255) for _ in range(3)]
         color = (0, 0, 255)
@@ -0,0 +1,71 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from libs.ComponentSpotDetector import ComponentSpotDetector
+
+
+def blob_params(min_area=0, max_area=10000):
+    # as CVSpotDetector.prepare_blob_detector_params() at the default sensitivity (recent OpenCV wants the lower
+    # bounds above 0)
+    params = cv.SimpleBlobDetector_Params()
+    params.minThreshold = 0
+    params.maxThreshold = 127
+    params.filterByArea = True
+    params.minArea = max(min_area, 1e-3)
+    params.maxArea = max_area
+    params.filterByColor = False
+    params.filterByCircularity = True
+    params.minCircularity = 1e-3
+    params.maxCircularity = 1
+    params.filterByConvexity = True
+    params.minConvexity = 1e-3
+    params.maxConvexity = 1
+    params.filterByInertia = True
+    params.minInertiaRatio = 1e-3
+    params.maxInertiaRatio = 1
+    params.minDistBetweenBlobs = 1e-3
+    return params
+
+
+def make_frame(rng, polarity, h=240, w=320):
+    """
+    dark: flecks on a bright fabric, bright: the residual of the background model (flecks and texture specks just
+    above the noise cut)
+    """
+    frame = np.full((h, w), 200 if polarity == 'dark' else 0, dtype=np.uint8)
+    # one fleck in every quadrant, two cut by the border of the frame
+    centers = [(x + rng.integers(20, w // 2 - 20), y + rng.integers(20, h // 2 - 20))
+               for x in (0, w // 2) for y in (0, h // 2)] + [(60, 0), (w - 1, 100)]
+    for x, y in centers:
+        # small or large, well apart from the min_area of the test, at a sub-pixel position (fixed point, 4 bits):
+        # the blob detector drops exactly symmetric contours (a shape ratio of 1)
+        axes = rng.integers(3, 5, 2) * rng.choice([1, 2])
+        center = (16 * np.array([x, y]) + rng.integers(0, 16, 2)).astype(int)
+        cv.ellipse(frame, tuple(center), tuple(int(a) for a in 16 * axes), int(rng.integers(0, 180)), 0, 360,
+                   40 if polarity == 'dark' else 200, -1, cv.LINE_AA, shift=4)
+    noise = rng.normal(0, 3, (h, w))
+    if polarity == 'bright':
+        noise[frame == 0] = 0
+        for _ in range(8):
+            x, y = rng.integers(4, w - 4), rng.integers(4, h - 4)
+            frame[y:y + 2, x:x + 2] = rng.integers(11, 15, (2, 2))
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize('polarity', ['dark', 'bright'])
+@pytest.mark.parametrize('min_area', [0, 100])
+def test_components_find_the_blobs(polarity, min_area):
+    params = blob_params(min_area=min_area)
+    blob_detector = cv.SimpleBlobDetector_create(params)
+    detector = ComponentSpotDetector()
+    detector.match_blob_params(params, polarity)
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        frame = make_frame(rng, polarity)
+        blobs = np.array([keypoint.pt for keypoint in blob_detector.detect(frame)]).reshape(-1, 2)
+        detections = detector.detect(frame)
+        assert len(detections) == len(blobs)
+        if len(blobs):
+            distance = np.hypot(blobs[:, None, 0] - detections['x'][None], blobs[:, None, 1] - detections['y'][None])
+            assert distance.min(axis=1).max() < 1.5
@@ -0,0 +1,40 @@
+import numpy as np
+
+from libs.Detections import SOURCE_CV, SOURCE_YOLO, empty_detections, fuse_detections
+
+
+def make_detections(boxes, score, source):
+    detections = empty_detections(len(boxes))
+    for d, (x, y, w, h) in zip(detections, boxes):
+        d['x'], d['y'], d['w'], d['h'] = x, y, w, h
+    detections['score'] = score
+    detections['source'] = source
+    return detections
+
+
+def test_vote_drops_cv_only_detection():
+    cv_detections = make_detections([(50, 50, 10, 10)], 1, SOURCE_CV)
+    fused = fuse_detections(cv_detections, empty_detections(), rule='vote')
+    assert len(fused) == 0
+
+
+def test_vote_drops_yolo_only_detection():
+    yolo_detections = make_detections([(50, 50, 20, 20)], 0.99, SOURCE_YOLO)
+    fused = fuse_detections(empty_detections(), yolo_detections, rule='vote')
+    assert len(fused) == 0
+
+
+def test_vote_keeps_matched_pair():
+    cv_detections = make_detections([(50, 50, 10, 10)], 1, SOURCE_CV)
+    yolo_detections = make_detections([(52, 51, 20, 20)], 0.4, SOURCE_YOLO)
+    fused = fuse_detections(cv_detections, yolo_detections, rule='vote')
+    assert len(fused) == 1
+    assert fused[0]['source'] == SOURCE_YOLO
+    assert np.isclose(fused[0]['score'], 0.7)
+
+
+def test_union_keeps_single_source_detections():
+    cv_detections = make_detections([(50, 50, 10, 10)], 1, SOURCE_CV)
+    yolo_detections = make_detections([(150, 150, 20, 20)], 0.99, SOURCE_YOLO)
+    fused = fuse_detections(cv_detections, yolo_detections, rule='union')
+    assert sorted(fused['source']) == [SOURCE_CV, SOURCE_YOLO]
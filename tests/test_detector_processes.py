@@ -0,0 +1,65 @@
+import queue
+
+import numpy as np
+import pytest
+
+DetectorProcesses = pytest.importorskip('DetectorProcesses')
+from Detector import BufferPackedResult, FrameResult
+from libs.SharedFrameRing import SharedFrameRing
+
+NUM_SLOTS = 6
+FRAME_SHAPE = (72, 128, 3)
+
+
+@pytest.fixture
+def ring():
+    ring = SharedFrameRing(NUM_SLOTS, 2 * (np.prod(FRAME_SHAPE) + SharedFrameRing.ALIGN))
+    yield ring
+    ring.close()
+
+
+def send_frame(ring, free_slots, in_queue, camera_id=0):
+    idx = free_slots.get_nowait()
+    frame = np.zeros(FRAME_SHAPE, np.uint8)
+    in_queue.put((idx, ring.write(idx, [frame, frame]), FrameResult(camera_id)))
+
+
+def test_dropped_results_return_their_slots(ring):
+    free_slots = queue.Queue()
+    for idx in range(NUM_SLOTS):
+        free_slots.put(idx)
+    in_queue = queue.Queue()
+    receiver = DetectorProcesses.SharedRingReceiver(ring, in_queue, free_slots, num_cameras=1)
+    mailbox = BufferPackedResult(1)  # output buffer of a detector
+    mailbox.on_drop = receiver.discard
+    # the receiver buffer (2 frames) overflows while the detector does not take any
+    for _ in range(NUM_SLOTS):
+        send_frame(ring, free_slots, in_queue)
+        assert receiver.receive()
+    # the detector finishes the waiting frames faster than they are taken from its output buffer
+    ret, packed_result = receiver.get()
+    while ret:
+        mailbox.put(packed_result)
+        ret, packed_result = receiver.get()
+    ret, packed_result = mailbox.get()
+    assert ret
+    idx, _ = receiver.release(packed_result)
+    free_slots.put(idx)
+    assert free_slots.qsize() == NUM_SLOTS
+    assert len(receiver.slots) == 0
+
+
+def test_get_latest_returns_skipped_slots(ring):
+    free_slots = queue.Queue()
+    for idx in range(NUM_SLOTS):
+        free_slots.put(idx)
+    in_queue = queue.Queue()
+    receiver = DetectorProcesses.SharedRingReceiver(ring, in_queue, free_slots, num_cameras=2)
+    for camera_id in (0, 1):
+        send_frame(ring, free_slots, in_queue, camera_id)
+    receiver.receive()
+    ret, packed_result = receiver.get_latest()
+    assert ret
+    receiver.discard(packed_result)
+    assert free_slots.qsize() == NUM_SLOTS
+    assert len(receiver.slots) == 0
@@ -0,0 +1,30 @@
+import pytest
+
+Detector = pytest.importorskip('Detector')
+
+
+def test_scheduler_values_are_not_saved(tmp_path):
+    config_file = str(tmp_path / 'config.dict')
+    settings = Detector.DetectSettings(config_file)
+    settings.set_setting_value('inputScale', 1.)
+    settings.get_or_set_setting_value('yoloTiling', False)
+    # a step of the quality scheduler, then the mode it switched to is saved
+    for setting_name, value in (('inputScale', 0.5), ('yoloTiling', True), ('frameSkip', 2)):
+        settings.override_setting_value(setting_name, value)
+    settings.set_setting_value('mode', 2)
+    assert settings.get_setting_value('inputScale') == 0.5
+    saved = Detector.DetectSettings(config_file).config_dict
+    assert saved['mode'] == 2
+    assert saved['inputScale'] == 1.
+    assert saved['yoloTiling'] is False
+    assert 'frameSkip' not in saved
+
+
+def test_operator_value_replaces_override(tmp_path):
+    config_file = str(tmp_path / 'config.dict')
+    settings = Detector.DetectSettings(config_file)
+    settings.override_setting_value('inputScale', 0.5)
+    settings.set_setting_value('inputScale', 0.75)
+    settings.override_setting_value('inputScale', 0.25)
+    settings.set_setting_value('mode', 0)
+    assert Detector.DetectSettings(config_file).config_dict['inputScale'] == 0.75
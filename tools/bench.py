@@ -0,0 +1,65 @@
+# Headless throughput benchmark / offline replay, no camera or UI needed:
+#   python3 tools/bench.py [camera|gstreamer|video|images|synthetic] [path] [cv|yolo|cascade|fused] [max seconds]
+import os
+import platform
+import sys
+import time
+
+# run from the repository root, like the app (config/, res/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Detector import DetectSettings, FramePreProcessor, CVSpotDetector, YoloV5Detector, FusedDetector
+from libs.Log import Log
+
+bench_args = sys.argv[1:] + [None] * 4
+bench_source = bench_args[0] or 'synthetic'
+bench_mode = bench_args[2] or 'cv'
+bench_duration = float(bench_args[3] or 30)
+bench_settings = DetectSettings(f'config/{platform.node()}_bench_config.dict')
+bench_settings.config_dict.update({'frameSource': bench_source, 'frameSourcePath': bench_args[1] or ''})
+
+bench_pre = FramePreProcessor(bench_settings)
+if bench_mode == 'yolo':
+    bench_detector = YoloV5Detector(bench_pre, bench_settings)
+    bench_pre.set_pre_process(False)
+elif bench_mode == 'cascade':
+    bench_detector = YoloV5Detector(bench_pre, bench_settings)
+    bench_detector.set_screener(CVSpotDetector(bench_pre, bench_settings))
+elif bench_mode == 'fused':
+    bench_detector = FusedDetector(bench_pre, bench_settings, CVSpotDetector(bench_pre, bench_settings),
+                                   YoloV5Detector(bench_pre, bench_settings))
+else:
+    bench_detector = CVSpotDetector(bench_pre, bench_settings)
+bench_pre.start_grabbers()
+bench_frames = 0
+bench_spots = 0
+bench_latencies = {}  # stage: summed ms
+bench_detector_latencies = {}  # detector: summed ms, fused mode
+bench_timer = time.time()
+while bench_pre.is_capturing() and time.time() - bench_timer < bench_duration:
+    bench_pre.main_body()
+    bench_detector.main_body()
+    ret, result = bench_detector.get()
+    while ret:
+        bench_frames += 1
+        bench_spots += result.num_spots
+        for stage, latency in result.stage_latencies().items():
+            bench_latencies[stage] = bench_latencies.get(stage, 0) + latency
+        for name, latency in result.detector_latency.items():
+            bench_detector_latencies[name] = bench_detector_latencies.get(name, 0) + latency
+        ret, result = bench_detector.get()
+bench_time = time.time() - bench_timer
+Log.info(f"{bench_frames} frames in {round(bench_time, 2)} s: {round(bench_frames / bench_time, 2)} FPS, "
+         f"{bench_spots} spots detected, {bench_pre.num_dropped} pre-processed frames dropped.")
+if bench_frames > 0:
+    Log.info("Mean latency per stage: " + ", ".join(
+        f"{stage} {round(latency / bench_frames, 2)} ms" for stage, latency in bench_latencies.items()))
+if len(bench_detector_latencies) > 0:
+    Log.info("Mean latency per detector: " + ", ".join(
+        f"{name} {round(latency / bench_frames, 2)} ms" for name, latency in bench_detector_latencies.items()))
+if bench_detector.strip_stitching:
+    Log.info(f"Strip stitching: {bench_detector.coverage_summary()}.")
+if bench_mode == 'cascade':
+    Log.info(f"Cascade: {round(bench_detector.gpu_frame_rate() * 100, 1)} % of the frames went to the engine.")
+bench_pre.on_end()
+bench_detector.on_end()